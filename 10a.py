@@ -1,6 +1,14 @@
-from typing import List
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Tuple
 from PIL import Image
 import matplotlib.pyplot as plt
+import numpy as np
 
 IMAGE_PATH = './img.png'
 
@@ -32,13 +40,59 @@ SHARPEN_MASK_5x5 = [
     [0.0, 0.0, -1.0, 0.0, 0.0]
 ]
 
-def read_grayscale_image(image_path: str) -> List[List[int]]:
-    img = Image.open(image_path).convert('L') 
-    width, height = img.size
-    pixels = list(img.getdata())
+# how pixels outside the image are filled, 'zero' matches calculate_mask_sum_for_pixel
+BORDER_MODES = {
+    'zero': 'constant',
+    'reflect': 'reflect',
+    'replicate': 'edge',
+    'wrap': 'wrap',
+}
 
-    grayscale_img = [pixels[i * width:(i + 1) * width] for i in range(height)]
-    return grayscale_img
+# 'int' keeps the unclipped rounded sums, 'uint8' saturates to 0..255, 'float32' skips rounding
+OUTPUT_TYPES = {
+    'int': np.int32,
+    'uint8': np.uint8,
+    'float32': np.float32,
+}
+
+# singular values below this fraction of the largest one are dropped when looking for a low rank kernel
+SEPARABLE_TOLERANCE = 1e-10
+MASK_CACHE_SIZE = 128
+
+METHODS = ('auto', 'direct', 'separable', 'fft', 'box')
+
+# weights that are whole multiples of 2^-EXACT_FRACTION_BITS (integers, 1/4, 3/16, ...) keep every
+# partial sum over an integer image exact, so the order of the sum doesn't change the result
+EXACT_FRACTION_BITS = 24
+# float64 holds every integer below this exactly
+EXACT_INTEGER_LIMIT = 2 ** 53
+
+# seconds per unit of work of every method on a typical desktop, used by method='auto'
+# until calibrate_convolution_costs (python 10a.py --calibrate) has measured this host
+DEFAULT_CONVOLUTION_COSTS = {
+    'direct': 1.3e-9,
+    'separable': 1.7e-9,
+    'fft': 3.9e-9,
+    'box': 1.4e-8,
+}
+
+# per host timings of the built-in benchmark, in the user's cache directory
+CALIBRATION_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'image_filters', 'convolution_calibration.json'
+)
+CALIBRATION_CACHE: Dict[str, Dict[str, float]] = {}
+
+class MaskDecomposition(NamedTuple):
+    path: str  # 'box', 'separable', 'low_rank' or 'direct'
+    rank: int
+    kernel: np.ndarray  # (y, x) order
+    terms: Tuple[Tuple[np.ndarray, np.ndarray], ...]  # (vertical, horizontal) 1-D kernels per rank-1 term
+    scale: int  # power of two that makes every kernel weight an integer, 0 if there is none
+    term_scale: int  # the same for the product of the rank-1 factors, 0 when they come from the SVD
+
+def read_grayscale_image(image_path: str) -> np.ndarray:
+    img = Image.open(image_path).convert('L')
+    return np.array(img)
 
 def calculate_mask_sum_for_pixel(
     mask: List[List[float | int]],
@@ -69,15 +123,577 @@ def calculate_mask_sum_for_pixel(
     return int(round(pixel_sum))
 
 
-def apply_mask_to_image(mask: List[List[float]], image: List[List[int]]) -> List[List[int]]:
-    height = len(image)          
-    width = len(image[0]) if height > 0 else 0 
-    new_image = [[0 for _ in range(width)] for _ in range(height)]
+# mask[i][j] weighs the pixel at x offset i and y offset j, so the kernel in image (y, x) order is the transpose
+def mask_to_kernel(mask: List[List[float]] | np.ndarray) -> np.ndarray:
+    kernel = np.asarray(mask, dtype=np.float64)
+    if kernel.ndim != 2 or kernel.shape[0] != kernel.shape[1]:
+        raise ValueError(f"Mask must be square, got shape {kernel.shape}")
+    return kernel.T
+
+def pad_image(image: List[List[int]] | np.ndarray, mask_size: int, border: str = 'zero') -> np.ndarray:
+    if border not in BORDER_MODES:
+        raise ValueError(f"border must be one of {list(BORDER_MODES)}, got '{border}'")
+    offset = mask_size // 2
+    pad_width = (offset, mask_size - 1 - offset)
+    return np.pad(np.asarray(image, dtype=np.float64), (pad_width, pad_width), mode=BORDER_MODES[border])
+
+# every tap is one shifted view of the padded image times its weight, accumulated
+# in the same order as calculate_mask_sum_for_pixel so zero padding reproduces it exactly
+def correlate_padded(padded: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    mask_size = kernel.shape[0]
+    height = padded.shape[0] - mask_size + 1
+    width = padded.shape[1] - mask_size + 1
+
+    result = np.zeros((height, width))
+    tap = np.empty((height, width))
+    for i in range(mask_size):
+        for j in range(mask_size):
+            weight = kernel[j, i]
+            if weight == 0:
+                continue
+            np.multiply(padded[j:j + height, i:i + width], weight, out=tap)
+            result += tap
+
+    return result
+
+def convert_output(result: np.ndarray, output: str = 'int') -> np.ndarray:
+    if output == 'int':
+        return np.rint(result).astype(np.int32)
+    if output == 'uint8':
+        return np.clip(np.rint(result), 0, 255).astype(np.uint8)
+    if output == 'float32':
+        return result.astype(np.float32)
+    raise ValueError(f"output must be one of {list(OUTPUT_TYPES)}, got '{output}'")
+
+# same result as correlate_padded for kernel == sum(outer(vertical, horizontal)),
+# each rank-1 term is a horizontal pass followed by a vertical pass, 2k instead of k * k taps per pixel
+def correlate_separable_padded(padded: np.ndarray, terms: Tuple[Tuple[np.ndarray, np.ndarray], ...]) -> np.ndarray:
+    mask_size = len(terms[0][0])
+    height = padded.shape[0] - mask_size + 1
+    width = padded.shape[1] - mask_size + 1
+
+    result = np.zeros((height, width))
+    for vertical, horizontal in terms:
+        rows_pass = np.zeros((padded.shape[0], width))
+        for i in range(mask_size):
+            if horizontal[i] != 0:
+                rows_pass += horizontal[i] * padded[:, i:i + width]
+        for j in range(mask_size):
+            if vertical[j] != 0:
+                result += vertical[j] * rows_pass[j:j + height]
+
+    return result
+
+# apply_mask_bank works through the image in strips of this many rows
+BANK_STRIP_ROWS = 64
+
+# side of the square tiles apply_mask_tiled hands to each worker
+TILE_SIZE = 1024
+
+# overlap-add works on blocks of this many padded pixels per side
+FFT_BLOCK_SIZE = 512
+
+# smallest 2^a * 3^b * 5^c >= n, those lengths are fast in np.fft
+def fft_length(n: int) -> int:
+    best = 1 << (n - 1).bit_length()
+    power_of_5 = 1
+    while power_of_5 < best:
+        power_of_3 = power_of_5
+        while power_of_3 < best:
+            remaining = -(-n // power_of_3)
+            best = min(best, power_of_3 * (1 << (remaining - 1).bit_length()))
+            power_of_3 *= 3
+        power_of_5 *= 5
+    return best
+
+def overlap_add_layout(padded_shape: Tuple[int, int], mask_size: int) -> Tuple[int, Tuple[int, int], int]:
+    block_size = min(FFT_BLOCK_SIZE, max(padded_shape))
+    fft_shape = (
+        fft_length(min(block_size, padded_shape[0]) + mask_size - 1),
+        fft_length(min(block_size, padded_shape[1]) + mask_size - 1),
+    )
+    block_count = -(-padded_shape[0] // block_size) * -(-padded_shape[1] // block_size)
+    return block_size, fft_shape, block_count
+
+# correlation is convolution with the flipped kernel; every block of the padded image is
+# convolved on its own and the overlapping tails are added up, then the part where the
+# kernel lies fully inside the padded image is kept, which is the same output as correlate_padded
+def correlate_fft_padded(padded: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    mask_size = kernel.shape[0]
+    padded_height, padded_width = padded.shape
+    block_size, fft_shape, _ = overlap_add_layout(padded.shape, mask_size)
+
+    kernel_spectrum = np.fft.rfft2(kernel[::-1, ::-1], fft_shape)
+    full = np.zeros((padded_height + mask_size - 1, padded_width + mask_size - 1))
+
+    for y in range(0, padded_height, block_size):
+        for x in range(0, padded_width, block_size):
+            block = padded[y:y + block_size, x:x + block_size]
+            out_height = block.shape[0] + mask_size - 1
+            out_width = block.shape[1] + mask_size - 1
+            convolved = np.fft.irfft2(np.fft.rfft2(block, fft_shape) * kernel_spectrum, fft_shape)
+            full[y:y + out_height, x:x + out_width] += convolved[:out_height, :out_width]
+
+    return full[mask_size - 1:padded_height, mask_size - 1:padded_width]
+
+# sum over every mask_size x mask_size window of the padded image from its summed-area table,
+# four lookups per pixel whatever the window size
+def box_sum_padded(padded: np.ndarray, mask_size: int) -> np.ndarray:
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    np.cumsum(padded, axis=0, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+
+    k = mask_size
+    return integral[k:, k:] - integral[:-k, k:] - integral[k:, :-k] + integral[:-k, :-k]
+
+# mean over a mask_size x mask_size window, same as applying a uniform blur mask of that size
+def box_filter(
+    image: List[List[int]] | np.ndarray,
+    mask_size: int,
+    border: str = 'zero',
+    output: str = 'int'
+) -> np.ndarray:
+    padded = pad_image(image, mask_size, border)
+    return convert_output(box_sum_padded(padded, mask_size) / (mask_size * mask_size), output)
+
+# odd box widths whose repeated application has the variance of a gaussian with this sigma
+# https://www.peterkovesi.com/papers/FastGaussianSmoothing.pdf
+def gaussian_box_sizes(sigma: float, passes: int = 3) -> List[int]:
+    ideal_width = math.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(ideal_width)
+    if lower % 2 == 0:
+        lower -= 1
+    upper = lower + 2
+    lower_count = round((12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+    return [lower if i < lower_count else upper for i in range(passes)]
+
+def gaussian_blur(
+    image: List[List[int]] | np.ndarray,
+    sigma: float,
+    passes: int = 3,
+    border: str = 'zero',
+    output: str = 'int'
+) -> np.ndarray:
+    result = np.asarray(image, dtype=np.float64)
+    for mask_size in gaussian_box_sizes(sigma, passes):
+        result = box_sum_padded(pad_image(result, mask_size, border), mask_size) / (mask_size * mask_size)
+    return convert_output(result, output)
+
+# smallest power of two that turns every value into an integer, 0 when there is none
+def dyadic_scale(values: np.ndarray) -> int:
+    for bits in range(EXACT_FRACTION_BITS + 1):
+        scaled = values * (1 << bits)
+        if np.all(scaled == np.floor(scaled)):
+            return 1 << bits
+    return 0
+
+# rank-1 factors read off the kernel itself, a column and a row over their shared pivot weight,
+# trying the smallest pivots first until both come out dyadic; unlike the SVD factors they are
+# exact for masks like outer([1, 4, 6, 4, 1], [1, 4, 6, 4, 1]) / 256. Returns the factors and
+# their combined dyadic scale, None if no pivot gives factors that multiply back to the kernel
+def exact_rank_one_term(kernel: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int] | None:
+    magnitudes = np.abs(kernel).ravel()
+    for pivot in np.argsort(magnitudes, kind='stable'):
+        if magnitudes[pivot] == 0:
+            continue
+        row, col = np.unravel_index(pivot, kernel.shape)
+        vertical = kernel[:, col].copy()
+        horizontal = kernel[row] / kernel[row, col]
+        scale = dyadic_scale(vertical) * dyadic_scale(horizontal)
+        if scale and np.array_equal(np.outer(vertical, horizontal), kernel):
+            return vertical, horizontal, scale
+    return None
+
+@lru_cache(maxsize=MASK_CACHE_SIZE)
+def decompose_mask_values(mask_values: Tuple[Tuple[float, ...], ...], tolerance: float) -> MaskDecomposition:
+    kernel = mask_to_kernel(mask_values)
+    mask_size = kernel.shape[0]
+
+    u, s, vt = np.linalg.svd(kernel)
+    rank = int(np.sum(s > tolerance * s[0])) if s[0] > 0 else 0
+    terms = tuple((u[:, r] * s[r], vt[r]) for r in range(rank))
+
+    term_scale = 0
+    exact_term = exact_rank_one_term(kernel) if rank == 1 else None
+    if exact_term is not None:
+        vertical, horizontal, term_scale = exact_term
+        terms = ((vertical, horizontal),)
+
+    # 1-D passes only pay off while they need fewer taps than the non-zero weights of the mask
+    if kernel[0, 0] != 0 and np.all(kernel == kernel[0, 0]):
+        path = 'box'
+    elif rank == 0 or 2 * mask_size * rank >= np.count_nonzero(kernel):
+        path = 'direct'
+    else:
+        path = 'separable' if rank == 1 else 'low_rank'
+
+    return MaskDecomposition(path, rank, kernel, terms, dyadic_scale(kernel), term_scale)
+
+# cached per mask, so filtering with the same mask again skips the SVD
+def decompose_mask(mask: List[List[float]] | np.ndarray, tolerance: float = SEPARABLE_TOLERANCE) -> MaskDecomposition:
+    mask_values = tuple(tuple(float(weight) for weight in row) for row in np.asarray(mask, dtype=np.float64))
+    return decompose_mask_values(mask_values, tolerance)
+
+# the measured costs if this host has been calibrated, otherwise the defaults; never benchmarks
+def load_calibration(path: str | None = None) -> Dict[str, float]:
+    path = path or CALIBRATION_PATH
+    if path not in CALIBRATION_CACHE:
+        try:
+            with open(path) as file:
+                costs = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            costs = {}
+        # written by an older version without every method
+        if any(method not in costs for method in METHODS[1:]):
+            costs = DEFAULT_CONVOLUTION_COSTS
+        CALIBRATION_CACHE[path] = costs
+    return CALIBRATION_CACHE[path]
+
+# seconds per unit of work for every method on this host, measured on a small image and written to `path`
+def calibrate_convolution_costs(path: str | None = None, size: int = 256, repeats: int = 3) -> Dict[str, float]:
+    path = path or CALIBRATION_PATH
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (size, size)).astype(np.float64)
+
+    def best_time(function, *args) -> float:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function(*args)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    dense = rng.random((7, 7))
+    separable = decompose_mask_values(tuple(map(tuple, np.outer(rng.random(7), rng.random(7)))), SEPARABLE_TOLERANCE)
+    large = rng.random((15, 15))
 
-    for y in range(height):
-        for x in range(width):
-            new_image[y][x] = calculate_mask_sum_for_pixel(mask, image, x, y)
-    return new_image
+    dense_padded = pad_image(image, 7)
+    large_padded = pad_image(image, 15)
+
+    costs = {
+        'direct': best_time(correlate_padded, dense_padded, dense) / (size * size * 49),
+        'separable': best_time(correlate_separable_padded, dense_padded, separable.terms) / (size * size * 14),
+        'fft': best_time(correlate_fft_padded, large_padded, large) / fft_work(large_padded.shape, 15),
+        'box': best_time(box_sum_padded, large_padded, 15) / (size * size),
+    }
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(costs, file, indent=2)
+    except OSError:
+        pass  # read only location, the costs are still used for this run
+
+    CALIBRATION_CACHE[path] = costs
+    return costs
+
+def fft_work(padded_shape: Tuple[int, int], mask_size: int) -> float:
+    _, fft_shape, block_count = overlap_add_layout(padded_shape, mask_size)
+    points = fft_shape[0] * fft_shape[1]
+    return block_count * points * math.log2(points)
+
+def estimate_costs(decomposition: MaskDecomposition, image_shape: Tuple[int, int]) -> Dict[str, float]:
+    costs = load_calibration()
+    mask_size = decomposition.kernel.shape[0]
+    pixels = image_shape[0] * image_shape[1]
+    padded_shape = (image_shape[0] + mask_size - 1, image_shape[1] + mask_size - 1)
+
+    estimates = {
+        'direct': costs['direct'] * pixels * max(1, np.count_nonzero(decomposition.kernel)),
+        'fft': costs['fft'] * fft_work(padded_shape, mask_size),
+    }
+    if decomposition.path != 'direct':
+        estimates['separable'] = costs['separable'] * pixels * 2 * mask_size * decomposition.rank
+    if decomposition.path == 'box':
+        estimates['box'] = costs['box'] * pixels
+    return estimates
+
+# largest pixel magnitude of an integer image (from the dtype for 8 and 16 bit images),
+# None for float images
+def integer_peak(image: np.ndarray) -> float | None:
+    if not np.issubdtype(image.dtype, np.integer):
+        return None
+    if image.dtype.itemsize <= 2:
+        info = np.iinfo(image.dtype)
+        return float(max(-info.min, info.max))
+    return float(np.abs(image).max()) if image.size else 0.0
+
+# the methods that give bit for bit the result of the direct path on an integer image with pixels
+# up to `peak`: box and separable sum in another order, which only can't matter when the weights
+# (or rank-1 factors) are dyadic and no partial sum outgrows the integers float64 holds exactly;
+# fft is never exact
+def exact_methods(decomposition: MaskDecomposition, image_shape: Tuple[int, int], peak: float | None) -> Tuple[str, ...]:
+    methods = ['direct']
+    if peak is None:
+        return tuple(methods)
+
+    mask_size = decomposition.kernel.shape[0]
+    padded_pixels = (image_shape[0] + mask_size - 1) * (image_shape[1] + mask_size - 1)
+    if (
+        decomposition.path == 'box' and decomposition.scale
+        and peak * np.abs(decomposition.kernel).sum() * decomposition.scale < EXACT_INTEGER_LIMIT
+        and peak * padded_pixels < EXACT_INTEGER_LIMIT
+    ):
+        methods.append('box')
+
+    if decomposition.path != 'direct' and decomposition.term_scale:
+        vertical, horizontal = decomposition.terms[0]
+        if peak * np.abs(vertical).sum() * np.abs(horizontal).sum() * decomposition.term_scale < EXACT_INTEGER_LIMIT:
+            methods.append('separable')
+
+    return tuple(methods)
+
+def choose_method(
+    decomposition: MaskDecomposition,
+    image_shape: Tuple[int, int],
+    methods: Tuple[str, ...] = METHODS[1:]
+) -> str:
+    estimates = estimate_costs(decomposition, image_shape)
+    return min((method for method in estimates if method in methods), key=estimates.get)
+
+def inspect_mask(
+    mask: List[List[float]] | np.ndarray,
+    image_shape: Tuple[int, int] | None = None,
+    tolerance: float = SEPARABLE_TOLERANCE
+) -> Dict[str, object]:
+    decomposition = decompose_mask(mask, tolerance)
+    mask_size = decomposition.kernel.shape[0]
+    if decomposition.path == 'direct':
+        multiply_adds = int(np.count_nonzero(decomposition.kernel))
+    elif decomposition.path == 'box':
+        multiply_adds = 4
+    else:
+        multiply_adds = 2 * mask_size * decomposition.rank
+    info = {
+        'path': decomposition.path,
+        'rank': decomposition.rank,
+        'mask_size': mask_size,
+        'multiply_adds_per_pixel': multiply_adds,
+    }
+    if image_shape is not None:
+        # what method='auto' would do with an 8-bit image of that shape
+        info['estimated_seconds'] = estimate_costs(decomposition, image_shape)
+        info['exact_methods'] = exact_methods(decomposition, image_shape, 255)
+        info['method'] = choose_method(decomposition, image_shape, info['exact_methods'])
+    return info
+
+# method='auto' picks the cheapest method from the calibrated cost model among those that give
+# exactly the direct result for this image and mask (see exact_methods), so its output never
+# depends on the host; an explicit 'separable', 'fft' or 'box' sums in another order and can round
+# the other way where a sum lands on .5 (e.g. 1/9 weights); every method pads the image the same way
+def apply_mask_to_image(
+    mask: List[List[float]],
+    image: List[List[int]] | np.ndarray,
+    border: str = 'zero',
+    output: str = 'int',
+    method: str = 'auto'
+) -> np.ndarray:
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got '{method}'")
+
+    image = np.asarray(image)
+    decomposition = decompose_mask(mask)
+    if method == 'box' and decomposition.path != 'box':
+        raise ValueError("method='box' needs a mask with equal weights")
+    padded = pad_image(image, decomposition.kernel.shape[0], border)
+
+    if method == 'auto':
+        method = choose_method(decomposition, image.shape, exact_methods(decomposition, image.shape, integer_peak(image)))
+
+    return convert_output(correlate_with_method(padded, decomposition, method), output)
+
+def correlate_with_method(padded: np.ndarray, decomposition: MaskDecomposition, method: str) -> np.ndarray:
+    if method == 'box' and decomposition.path == 'box':
+        return box_sum_padded(padded, decomposition.kernel.shape[0]) * decomposition.kernel[0, 0]
+    if method == 'fft':
+        return correlate_fft_padded(padded, decomposition.kernel)
+    if method == 'separable' and decomposition.terms:
+        return correlate_separable_padded(padded, decomposition.terms)
+    return correlate_padded(padded, decomposition.kernel)
+
+# .npy files are memory-mapped with their own header, anything else is read as raw bytes of `shape`
+def open_image_buffer(path: str, shape: Tuple[int, int] | None = None, dtype: np.dtype = np.uint8) -> np.ndarray:
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    if shape is None:
+        raise ValueError(f"Raw image '{path}' needs an explicit shape")
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+# one time conversion for formats that can't be memory-mapped (png, jpeg, ...)
+def convert_image_to_npy(image_path: str, npy_path: str) -> str:
+    np.save(npy_path, read_grayscale_image(image_path))
+    return npy_path
+
+# index of the source pixel for every padded position in [start, stop), following BORDER_MODES;
+# positions that are outside of the image in 'zero' mode are returned as -1
+def border_indices(start: int, stop: int, size: int, border: str) -> np.ndarray:
+    indices = np.arange(start, stop)
+    if border == 'zero':
+        return np.where((indices >= 0) & (indices < size), indices, -1)
+    if border == 'replicate':
+        return np.clip(indices, 0, size - 1)
+    if border == 'wrap':
+        return indices % size
+    if border == 'reflect':
+        if size == 1:
+            return np.zeros_like(indices)
+        period = 2 * size - 2
+        indices = indices % period
+        return np.where(indices >= size, period - indices, indices)
+    raise ValueError(f"border must be one of {list(BORDER_MODES)}, got '{border}'")
+
+# the tile plus a halo of kernel radius pixels, padded exactly like pad_image pads the whole image
+def read_tile_with_halo(
+    image: np.ndarray,
+    rows: Tuple[int, int],
+    cols: Tuple[int, int],
+    mask_size: int,
+    border: str = 'zero'
+) -> np.ndarray:
+    offset = mask_size // 2
+    row_indices = border_indices(rows[0] - offset, rows[1] + mask_size - 1 - offset, image.shape[0], border)
+    col_indices = border_indices(cols[0] - offset, cols[1] + mask_size - 1 - offset, image.shape[1], border)
+
+    if border != 'zero':
+        return image[np.ix_(row_indices, col_indices)].astype(np.float64)
+
+    # zero padding only needs the in-bounds block, read as one contiguous slice
+    tile = np.zeros((len(row_indices), len(col_indices)))
+    valid_rows = np.flatnonzero(row_indices >= 0)
+    valid_cols = np.flatnonzero(col_indices >= 0)
+    if len(valid_rows) and len(valid_cols):
+        tile[valid_rows[0]:valid_rows[-1] + 1, valid_cols[0]:valid_cols[-1] + 1] = image[
+            row_indices[valid_rows[0]]:row_indices[valid_rows[-1]] + 1,
+            col_indices[valid_cols[0]]:col_indices[valid_cols[-1]] + 1,
+        ]
+    return tile
+
+def filter_tile(
+    input_path: str,
+    input_shape: Tuple[int, int] | None,
+    output_path: str,
+    mask: List[List[float]],
+    border: str,
+    output: str,
+    method: str,
+    rows: Tuple[int, int],
+    cols: Tuple[int, int]
+) -> None:
+    image = open_image_buffer(input_path, input_shape)
+    result_image = np.load(output_path, mmap_mode='r+')
+
+    decomposition = decompose_mask(mask)
+    padded = read_tile_with_halo(image, rows, cols, decomposition.kernel.shape[0], border)
+    result = correlate_with_method(padded, decomposition, method)
+
+    result_image[rows[0]:rows[1], cols[0]:cols[1]] = convert_output(result, output)
+    result_image.flush()
+    del result_image, image
+
+# out-of-core apply_mask_to_image: the input is memory-mapped, tiles (with their halo) are
+# filtered in worker processes and written straight into a memory-mapped .npy output,
+# so peak memory is about tile_size^2 per worker instead of the whole image
+def apply_mask_tiled(
+    mask: List[List[float]],
+    input_path: str,
+    output_path: str,
+    border: str = 'zero',
+    output: str = 'uint8',
+    method: str = 'auto',
+    tile_size: int = TILE_SIZE,
+    workers: int | None = None,
+    input_shape: Tuple[int, int] | None = None
+) -> np.ndarray:
+    if border not in BORDER_MODES:
+        raise ValueError(f"border must be one of {list(BORDER_MODES)}, got '{border}'")
+    if output not in OUTPUT_TYPES:
+        raise ValueError(f"output must be one of {list(OUTPUT_TYPES)}, got '{output}'")
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got '{method}'")
+
+    if method == 'box' and decompose_mask(mask).path != 'box':
+        raise ValueError("method='box' needs a mask with equal weights")
+
+    image = open_image_buffer(input_path, input_shape)
+    height, width = image.shape
+    peak = integer_peak(image)
+    del image
+
+    result_image = np.lib.format.open_memmap(output_path, mode='w+', dtype=OUTPUT_TYPES[output], shape=(height, width))
+    del result_image
+
+    if method == 'auto':
+        decomposition = decompose_mask(mask)
+        tile_shape = (min(tile_size, height), min(tile_size, width))
+        method = choose_method(decomposition, tile_shape, exact_methods(decomposition, tile_shape, peak))
+
+    mask = np.asarray(mask, dtype=np.float64).tolist()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                filter_tile, input_path, input_shape, output_path, mask, border, output, method,
+                (y, min(y + tile_size, height)), (x, min(x + tile_size, width))
+            )
+            for y in range(0, height, tile_size)
+            for x in range(0, width, tile_size)
+        ]
+        for future in futures:
+            future.result()
+
+    return np.load(output_path, mmap_mode='r')
+
+# several masks in one traversal: every distinct tap offset of all masks is loaded once per strip
+# of rows and reused by each mask that has a weight there (e.g. the shared centre cross of the
+# sharpen masks), results go into one (K, H, W) output; taps are accumulated in the same order
+# as correlate_padded, so every layer is identical to the direct path for that mask
+def apply_mask_bank(
+    masks: List[List[List[float]]],
+    image: List[List[int]] | np.ndarray,
+    border: str = 'zero',
+    output: str = 'int',
+    out: np.ndarray | None = None
+) -> np.ndarray:
+    if border not in BORDER_MODES:
+        raise ValueError(f"border must be one of {list(BORDER_MODES)}, got '{border}'")
+    if output not in OUTPUT_TYPES:
+        raise ValueError(f"output must be one of {list(OUTPUT_TYPES)}, got '{output}'")
+
+    image = np.asarray(image)
+    height, width = image.shape
+    kernels = [mask_to_kernel(mask) for mask in masks]
+
+    if out is None:
+        out = np.empty((len(kernels), height, width), dtype=OUTPUT_TYPES[output])
+    elif out.shape != (len(kernels), height, width):
+        raise ValueError(f"out must have shape {(len(kernels), height, width)}, got {out.shape}")
+
+    # one padded frame that fits every mask, masks are aligned on their centre pixel
+    before = max(kernel.shape[0] // 2 for kernel in kernels)
+    after = max(kernel.shape[0] - 1 - kernel.shape[0] // 2 for kernel in kernels)
+    padded = np.pad(image.astype(np.float64), ((before, after), (before, after)), mode=BORDER_MODES[border])
+
+    taps: Dict[Tuple[int, int], List[Tuple[int, float]]] = {}
+    for index, kernel in enumerate(kernels):
+        shift = before - kernel.shape[0] // 2
+        for i in range(kernel.shape[0]):
+            for j in range(kernel.shape[0]):
+                if kernel[j, i] != 0:
+                    taps.setdefault((shift + i, shift + j), []).append((index, kernel[j, i]))
+
+    for y in range(0, height, BANK_STRIP_ROWS):
+        rows = min(BANK_STRIP_ROWS, height - y)
+        accumulated = np.zeros((len(kernels), rows, width))
+        tap = np.empty((rows, width))
+
+        for (dx, dy), users in sorted(taps.items()):
+            view = padded[y + dy:y + dy + rows, dx:dx + width]
+            for index, weight in users:
+                np.multiply(view, weight, out=tap)
+                accumulated[index] += tap
+
+        out[:, y:y + rows] = convert_output(accumulated, output)
+
+    return out
 
 def save_image_comparison(
     original: List[List[int]], 
@@ -117,15 +733,24 @@ def save_image_comparison(
     img = Image.open(filename)
     img.show()
 
+def calibrate_main():
+    costs = calibrate_convolution_costs()
+    for method, cost in costs.items():
+        print(f"{method}: {cost:.3e} s per unit of work")
+    print(f"Calibration saved to file '{CALIBRATION_PATH}'")
+
 def main():
     grayscale_image = read_grayscale_image(IMAGE_PATH)
-    sharpened_image_3x3 = apply_mask_to_image(SHARPEN_MASK_3x3, grayscale_image)
-    blurred_image_3x3 = apply_mask_to_image(BLUR_MASK_3x3, grayscale_image)
-    sharpened_image_5x5 = apply_mask_to_image(SHARPEN_MASK_5x5, grayscale_image)
-    blurred_image_5x5 = apply_mask_to_image(BLUR_MASK_5x5, grayscale_image)
+    sharpened_image_3x3, blurred_image_3x3, sharpened_image_5x5, blurred_image_5x5 = apply_mask_bank(
+        [SHARPEN_MASK_3x3, BLUR_MASK_3x3, SHARPEN_MASK_5x5, BLUR_MASK_5x5],
+        grayscale_image
+    )
 
     save_image_comparison(grayscale_image, sharpened_image_3x3, blurred_image_3x3, sharpened_image_5x5, blurred_image_5x5)
 
 if __name__ == "__main__":
-    main()
+    if '--calibrate' in sys.argv[1:]:
+        calibrate_main()
+    else:
+        main()
 
@@ -1,23 +1,14 @@
-from typing import List
+from typing import List, Tuple
 from PIL import Image
 import matplotlib.pyplot as plt
+import numpy as np
+from histogram_lut import apply_lut, apply_lut_to_files, build_threshold_lut, calculate_histogram, histogram_of_files
 
 IMAGE_PATH = './img.png'
 
-def read_grayscale_image(image_path: str) -> List[List[int]]:
-    img = Image.open(image_path).convert('L') 
-    width, height = img.size
-    pixels = list(img.getdata())
-
-    grayscale_img = [pixels[i * width:(i + 1) * width] for i in range(height)]
-    return grayscale_img
-
-def calculate_histogram(grayscale_image: List[List[int]]) -> List[int]:
-    histogram = [0] * 256
-    for row in grayscale_image:
-        for pixel in row:
-            histogram[pixel] += 1
-    return histogram
+def read_grayscale_image(image_path: str) -> np.ndarray:
+    img = Image.open(image_path).convert('L')
+    return np.array(img)
 
 def save_image_comparison(
     original_image: List[List[int]], 
@@ -43,46 +34,96 @@ def save_image_comparison(
     img.show()
 
 # Otsu's method https://en.wikipedia.org/wiki/Otsu%27s_method
-def calculate_threshold(histogram: List[int]) -> int:
-    total_pixel_count = sum(histogram)
-    weighted_total_intensity = sum(i * histogram[i] for i in range(len(histogram)))
-
-    background_weight = 0
-    background_total_sum = 0 
-    highest_variance_between_classes = 0
-    optimal_threshold = 0
-
-    for t in range(len(histogram)):
-        background_weight += histogram[t]
-        if background_weight == 0:
-            continue
-        foreground_weight = total_pixel_count - background_weight
-        if foreground_weight == 0:
-            break
-
-        background_total_sum += t* histogram[t]
+# between class variance for every threshold t (background is <= t) from cumulative sums,
+# thresholds that leave one class empty get 0
+def calculate_between_class_variance(histogram: List[int] | np.ndarray) -> np.ndarray:
+    counts = np.asarray(histogram, dtype=np.int64)
+    background_weight = np.cumsum(counts)
+    background_total_sum = np.cumsum(np.arange(len(counts)) * counts)
+
+    total_pixel_count = background_weight[-1]
+    weighted_total_intensity = background_total_sum[-1]
+    foreground_weight = total_pixel_count - background_weight
+    valid = (background_weight > 0) & (foreground_weight > 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
         background_mean = background_total_sum / background_weight
         foreground_mean = (weighted_total_intensity - background_total_sum) / foreground_weight
-
-        between_class_variance = background_weight * foreground_weight * (background_mean - foreground_mean) ** 2
-
-        if between_class_variance > highest_variance_between_classes:
-            highest_variance_between_classes = between_class_variance
-            optimal_threshold = t
-    
-    return optimal_threshold
-
-def apply_threshhold_to_image(image: List[List[int]], threshhold: int):
-    new_image = []
-    for row in image:
-        new_row = []
-        for p in row:
-            if p > threshhold:
-                new_row.append(255)
-            else:
-                new_row.append(0)
-        new_image.append(new_row)
-    return new_image
+        # float64 weights: the int64 product overflows for histograms above ~6.1e9 pixels (dataset-wide ones)
+        between_class_variance = background_weight.astype(np.float64) * foreground_weight * (background_mean - foreground_mean) ** 2
+
+    return np.where(valid, between_class_variance, 0.0)
+
+def calculate_threshold_with_variance(histogram: List[int] | np.ndarray) -> Tuple[int, np.ndarray]:
+    between_class_variance = calculate_between_class_variance(histogram)
+    # first maximum, 0 when no threshold separates two classes
+    return int(np.argmax(between_class_variance)), between_class_variance
+
+def calculate_threshold(histogram: List[int] | np.ndarray) -> int:
+    return calculate_threshold_with_variance(histogram)[0]
+
+# thresholds t1 < ... < t(K-1) splitting the histogram into K classes with the highest between
+# class variance; maximizing it is the same as maximizing sum(class_sum^2 / class_count), which
+# the (L, L) table of every class [a, b] gives from prefix moments, and dynamic programming
+# over the class ends finds the best split in O(K * L^2) instead of trying all O(L^K) of them
+def calculate_multi_level_thresholds(histogram: List[int] | np.ndarray, classes: int = 3) -> List[int]:
+    counts = np.asarray(histogram, dtype=np.float64)
+    levels = len(counts)
+    if not 2 <= classes <= levels:
+        raise ValueError(f"classes must be between 2 and {levels}, got {classes}")
+
+    prefix_count = np.concatenate([[0.0], np.cumsum(counts)])
+    prefix_sum = np.concatenate([[0.0], np.cumsum(np.arange(levels) * counts)])
+
+    # class_score[a, b] for the class of levels a..b, -inf for a > b
+    class_count = prefix_count[None, 1:] - prefix_count[:-1, None]
+    class_sum = prefix_sum[None, 1:] - prefix_sum[:-1, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        class_score = np.where(class_count > 0, class_sum * class_sum / class_count, 0.0)
+    class_score[np.tril_indices(levels, -1)] = -np.inf
+
+    # best[b]: best score for levels 0..b split into the classes so far
+    best = class_score[0].copy()
+    starts = []
+    for _ in range(classes - 1):
+        # the new last class starts at a >= 1 and extends the best split of 0..a-1
+        candidates = np.full((levels, levels), -np.inf)
+        candidates[1:] = best[:-1, None] + class_score[1:]
+        start = np.argmax(candidates, axis=0)
+        best = candidates[start, np.arange(levels)]
+        starts.append(start)
+
+    thresholds = []
+    end = levels - 1
+    for start in reversed(starts):
+        end = start[end] - 1
+        thresholds.append(int(end))
+
+    return thresholds[::-1]
+
+# one threshold binarizes to 0 / 255, several (from calculate_multi_level_thresholds) quantize to evenly spaced levels
+def apply_threshhold_to_image(
+    image: List[List[int]] | np.ndarray,
+    threshhold: int | List[int],
+    in_place: bool = False
+) -> np.ndarray:
+    return apply_lut(image, build_threshold_lut(threshhold), in_place)
+
+# one otsu threshold over every image, counted chunk by chunk without loading them all
+def calculate_dataset_threshold(image_paths: List[str], workers: int = 1) -> int:
+    return calculate_threshold(histogram_of_files(image_paths, workers).counts)
+
+def threshold_files(image_paths: List[str], output_paths: List[str], workers: int = 1) -> int:
+    threshold = calculate_dataset_threshold(image_paths, workers)
+    apply_lut_to_files(image_paths, output_paths, build_threshold_lut(threshold), workers)
+    return threshold
+
+# binary 0 / 255 image stored as 1 bit per pixel, rows padded to whole bytes
+def pack_binary_image(binary_image: np.ndarray) -> np.ndarray:
+    return np.packbits(np.asarray(binary_image) > 0, axis=-1)
+
+def unpack_binary_image(packed_image: np.ndarray, width: int) -> np.ndarray:
+    return np.unpackbits(packed_image, axis=-1, count=width) * np.uint8(255)
 
 def main():
     grayscale_image = read_grayscale_image(IMAGE_PATH)
@@ -1,14 +1,30 @@
 import math
+import os
 import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib import cm
 import matplotlib.pyplot as plt
+import numpy as np
+from PIL import GifImagePlugin, Image
 from typing import List, Tuple
 
 # constants (min polygon vertices: 3 and min step: 1)
-# polygon end and start vertice difference can`t be bigger than step count
 POLYGON_START_VERTICES = 4
 POLYGON_END_VERTICES = 11
 PARAMETRIC_INTERPOLATION_STEPS = 7
+MORPH_DTYPE = np.float32
+MORPH_BLOCK_FRAMES = 64  # frames computed per broadcast, bounds the float64 temporaries
+
+# offscreen animation
+ANIMATION_SIZE = (640, 480)
+ANIMATION_FPS = 10
+ANIMATION_MARGIN = 0.05  # fraction of the image left free around the morph
+ANIMATION_BACKGROUND = (255, 255, 255)
+ANIMATION_NAME = "morph.gif"
+ANIMATION_FRAMES_IN_FLIGHT = 2  # rendered frames waiting to be written, per worker
 
 # generates a regular polygon with `n` vertices evenly spaced around a circle of radius `r`.
 # returns a list of (x, y) coordinate tuples for each vertex.
@@ -27,18 +43,19 @@ def generate_polygon_vertices(n: int) -> List[Tuple[float, float]]:
     
     return polygon_vertices
 
-def remove_vertex(polygon_vertices: List[Tuple[float, float]]) -> None:
+# rng makes the choice reproducible (e.g. random.Random(seed)), the global generator otherwise
+def remove_vertex(polygon_vertices: List[Tuple[float, float]], rng: random.Random | None = None) -> None:
     if len(polygon_vertices) == 0:
         return
     
-    random_index = random.randint(0, len(polygon_vertices) - 1)
+    random_index = (rng or random).randint(0, len(polygon_vertices) - 1)
     polygon_vertices.pop(random_index)
 
-def add_vertex(polygon_vertices: List[Tuple[float, float]]) -> None:
+def add_vertex(polygon_vertices: List[Tuple[float, float]], rng: random.Random | None = None) -> None:
     if len(polygon_vertices) == 0:
         return
     
-    random_index = random.randint(0, len(polygon_vertices) - 1)
+    random_index = (rng or random).randint(0, len(polygon_vertices) - 1)
 
     vertex_before = polygon_vertices[random_index]
     # takes first vertex if out bounds
@@ -68,6 +85,66 @@ def parametric_interpolate_polygon(polygon_start, polygon_end, t):
 
     return interpolated_polygon
 
+# position of every vertex along the closed outline as a fraction of the perimeter, starting at
+# 0 for the first vertex; the closing vertex (fraction 1) is included as the last entry
+def arc_length_parameters(polygon: np.ndarray) -> np.ndarray:
+    closed = np.concatenate([polygon, polygon[:1]])
+    lengths = np.hypot(*np.diff(closed, axis=0).T)
+    cumulative = np.concatenate(([0.0], np.cumsum(lengths)))
+    if cumulative[-1] == 0:
+        return np.linspace(0, 1, len(closed))
+    return cumulative / cumulative[-1]
+
+# points at the given perimeter fractions in [0, 1), linearly interpolated along the edges
+def sample_polygon(polygon: np.ndarray, parameters: np.ndarray) -> np.ndarray:
+    closed = np.concatenate([polygon, polygon[:1]])
+    cumulative = arc_length_parameters(polygon)
+
+    segment = np.clip(np.searchsorted(cumulative, parameters, side="right") - 1, 0, len(polygon) - 1)
+    segment_length = cumulative[segment + 1] - cumulative[segment]
+    local = np.divide(parameters - cumulative[segment], segment_length,
+                      out=np.zeros(len(parameters)), where=segment_length > 0)
+
+    return closed[segment] + local[:, None] * (closed[segment + 1] - closed[segment])
+
+# both polygons resampled to the same vertex count with matching perimeter fractions, so vertex
+# i of one corresponds to vertex i of the other; by default the samples are the vertices of both
+# polygons (every corner survives exactly), with vertex_count they are evenly spaced instead
+def correspond_polygons(polygon_start, polygon_end, vertex_count: int | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    start = np.asarray(polygon_start, dtype=np.float64).reshape(-1, 2)
+    end = np.asarray(polygon_end, dtype=np.float64).reshape(-1, 2)
+    if len(start) < 3 or len(end) < 3:
+        raise ValueError("A polygon must have at least 3 vertices.")
+
+    if vertex_count is None:
+        parameters = np.sort(np.concatenate([arc_length_parameters(start)[:-1], arc_length_parameters(end)[:-1]]))
+        parameters = parameters[np.concatenate(([True], parameters[1:] != parameters[:-1]))]
+    else:
+        parameters = np.arange(vertex_count) / vertex_count
+
+    return sample_polygon(start, parameters), sample_polygon(end, parameters)
+
+# every frame of the morph at once: (steps + 1, N, 2), frame k at t = k / steps; frames are
+# written block by block, into `out` when given (e.g. a memory-mapped .npy for huge morphs)
+def morph_frames(polygon_start, polygon_end, steps: int, vertex_count: int | None = None,
+                 out: np.ndarray | None = None) -> np.ndarray:
+    if steps < 1:
+        raise ValueError("A morph needs at least 1 step.")
+
+    start, end = correspond_polygons(polygon_start, polygon_end, vertex_count)
+    delta = end - start
+    t = np.linspace(0, 1, steps + 1)
+
+    frames = np.empty((steps + 1, len(start), 2), dtype=MORPH_DTYPE) if out is None else out
+    if frames.shape != (steps + 1, len(start), 2):
+        raise ValueError(f"Expected an output of shape {(steps + 1, len(start), 2)}, got {frames.shape}")
+
+    for block_start in range(0, steps + 1, MORPH_BLOCK_FRAMES):
+        block = t[block_start:block_start + MORPH_BLOCK_FRAMES, None, None]
+        frames[block_start:block_start + len(block)] = start + block * delta
+
+    return frames
+
 def morph_polygon(polygon_start, polygon_end, steps):
     _, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 6))
 
@@ -83,20 +160,13 @@ def morph_polygon(polygon_start, polygon_end, steps):
     ax2.set_ylabel("Y-axis")
 
     colors = cm.viridis([i / steps for i in range(steps + 1)])
+    frames = morph_frames(polygon_start, polygon_end, steps)
     
-    for step in range(steps + 1):
-        t = step / steps
-
-        interpolated_polygon = parametric_interpolate_polygon(polygon_start, polygon_end, t)
-
-        if len(polygon_start) > len(polygon_end):
-            remove_vertex(polygon_start)
-        elif len(polygon_start) < len(polygon_end):
-            add_vertex(polygon_start)
-
-        x_vals, y_vals = zip(*interpolated_polygon)  
+    for step, frame in enumerate(frames):
+        x_vals = np.append(frame[:, 0], frame[0, 0])
+        y_vals = np.append(frame[:, 1], frame[0, 1])
     
-        ax2.plot(x_vals + (x_vals[0],), y_vals + (y_vals[0],), label=f'Step {step}', marker='o', color=colors[step])
+        ax2.plot(x_vals, y_vals, label=f'Step {step}', marker='o', color=colors[step])
 
         plt.pause(1)  
 
@@ -104,17 +174,178 @@ def morph_polygon(polygon_start, polygon_end, steps):
     plt.tight_layout()
     plt.show()
 
-def main():
-    min_polygon = min(POLYGON_START_VERTICES, POLYGON_END_VERTICES)
-    max_polygon = max(POLYGON_START_VERTICES, POLYGON_END_VERTICES)
+# palette index 0 is the background, frame k of `steps` is drawn with the viridis colour at
+# k / steps (like the morph plot) in one of the remaining 255 entries
+def animation_palette() -> np.ndarray:
+    palette = np.empty((256, 3), dtype=np.uint8)
+    palette[0] = ANIMATION_BACKGROUND
+    palette[1:] = np.rint(cm.viridis(np.linspace(0, 1, 255))[:, :3] * 255)
+    return palette
+
+def frame_color_index(step: int, steps: int) -> int:
+    return 1 + round(254 * step / max(steps, 1))
+
+# one scale and offset for all frames (equal on both axes, y up) so the morph does not jump
+def fit_frames_to_image(frames: np.ndarray, size: Tuple[int, int]) -> Tuple[float, float, float]:
+    width, height = size
+    lower = frames.min(axis=(0, 1)).astype(np.float64)
+    extent = np.maximum(frames.max(axis=(0, 1)) - lower, 1e-12)
+    scale = (1 - 2 * ANIMATION_MARGIN) * min((width - 1) / extent[0], (height - 1) / extent[1])
+    x_offset = ((width - 1) - scale * extent[0]) / 2 - scale * lower[0]
+    y_offset = ((height - 1) - scale * extent[1]) / 2 - scale * lower[1]
+    return scale, x_offset, y_offset
+
+# closed outline of one frame into a palette-index image, every edge sampled once per pixel step
+def rasterize_polyline(frame: np.ndarray, size: Tuple[int, int], transform: Tuple[float, float, float],
+                       color_index: int) -> np.ndarray:
+    width, height = size
+    scale, x_offset, y_offset = transform
+    image = np.zeros((height, width), dtype=np.uint8)
+
+    points = np.empty((len(frame), 2))
+    points[:, 0] = x_offset + scale * frame[:, 0]
+    points[:, 1] = (height - 1) - (y_offset + scale * frame[:, 1])
+    starts = points
+    deltas = np.roll(points, -1, axis=0) - points
 
-    if (max_polygon - min_polygon) > PARAMETRIC_INTERPOLATION_STEPS:
-        raise ValueError("POLYGON_START_VERTICES and POLYGON_END_VERTICES difference can`t be bigger than PARAMETRIC_INTERPOLATION_STEP count")
+    steps = np.ceil(np.abs(deltas).max(axis=1)).astype(np.int64)
+    counts = steps + 1
+    edge = np.repeat(np.arange(len(points)), counts)
+    sample = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = sample / np.maximum(steps, 1)[edge]
 
+    x = np.rint(starts[edge, 0] + t * deltas[edge, 0]).astype(np.int64)
+    y = np.rint(starts[edge, 1] + t * deltas[edge, 1]).astype(np.int64)
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    image[y[inside], x[inside]] = color_index
+    return image
+
+def render_frame(frame: np.ndarray, step: int, steps: int, size: Tuple[int, int],
+                 transform: Tuple[float, float, float]) -> np.ndarray:
+    return rasterize_polyline(frame, size, transform, frame_color_index(step, steps))
+
+def palette_image(indices: np.ndarray, palette: np.ndarray) -> Image.Image:
+    height, width = indices.shape
+    image = Image.frombuffer("P", (width, height), np.ascontiguousarray(indices), "raw", "P", 0, 1)
+    image.putpalette(palette.tobytes())
+    return image
+
+# writers take palette-index frames one at a time and keep nothing but the open file
+class GifWriter:
+    def __init__(self, path: str, palette: np.ndarray, fps: float):
+        self.file = open(path, "wb")
+        self.palette = palette
+        self.duration = round(1000 / fps)
+        self.started = False
+
+    def write(self, indices: np.ndarray) -> None:
+        image = palette_image(indices, self.palette)
+        if not self.started:
+            header, _ = GifImagePlugin.getheader(image, self.palette.tobytes(), {"loop": 0, "optimize": False})
+            self.file.write(b"".join(header))
+            self.started = True
+        self.file.write(b"".join(GifImagePlugin.getdata(image, duration=self.duration)))
+
+    def close(self) -> None:
+        self.file.write(b";")
+        self.file.close()
+
+# `directory/frame_00000.png`, `directory/frame_00001.png`, ...
+class PngSequenceWriter:
+    def __init__(self, directory: str, palette: np.ndarray):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.palette = palette
+        self.count = 0
+
+    def write(self, indices: np.ndarray) -> None:
+        palette_image(indices, self.palette).save(os.path.join(self.directory, f"frame_{self.count:05d}.png"))
+        self.count += 1
+
+    def close(self) -> None:
+        pass
+
+# headerless rgb24 frames back to back, e.g. for
+# `ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH -r FPS -i morph.rgb morph.mp4`
+class RawVideoWriter:
+    def __init__(self, path: str, palette: np.ndarray):
+        self.file = open(path, "wb")
+        self.palette = palette
+
+    def write(self, indices: np.ndarray) -> None:
+        self.file.write(self.palette[indices].tobytes())
+
+    def close(self) -> None:
+        self.file.close()
+
+# .gif, .rgb / .raw (raw video) or anything else as a directory of png frames
+def open_animation_writer(path: str, palette: np.ndarray, fps: float):
+    if path.endswith(".gif"):
+        return GifWriter(path, palette, fps)
+    if path.endswith((".rgb", ".raw")):
+        return RawVideoWriter(path, palette)
+    return PngSequenceWriter(path, palette)
+
+# renders every frame of a morph (e.g. from morph_frames) offscreen and streams them to `path`
+# in order; with workers > 1 frames render in a process pool while at most
+# ANIMATION_FRAMES_IN_FLIGHT frames per worker wait to be written, so memory stays flat however
+# long the clip is; returns the frames per second achieved
+def render_morph_animation(
+    frames: np.ndarray,
+    path: str = ANIMATION_NAME,
+    size: Tuple[int, int] = ANIMATION_SIZE,
+    fps: float = ANIMATION_FPS,
+    workers: int = 1,
+    executor: ProcessPoolExecutor | None = None
+) -> float:
+    steps = len(frames) - 1
+    transform = fit_frames_to_image(frames, size)
+    writer = open_animation_writer(path, animation_palette(), fps)
+    start = time.perf_counter()
+
+    own_executor = executor is None and workers > 1
+    try:
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=workers)
+
+        if executor is None:
+            for step, frame in enumerate(frames):
+                writer.write(render_frame(frame, step, steps, size, transform))
+        else:
+            pending = deque()
+            max_in_flight = ANIMATION_FRAMES_IN_FLIGHT * max(workers, 1)
+            for step, frame in enumerate(frames):
+                if len(pending) >= max_in_flight:
+                    writer.write(pending.popleft().result())
+                pending.append(executor.submit(render_frame, np.asarray(frame), step, steps, size, transform))
+            while pending:
+                writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+        if own_executor and executor is not None:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    frames_per_second = len(frames) / elapsed if elapsed > 0 else float("inf")
+    print(f"Rendered {len(frames)} frames to '{path}' in {elapsed:.2f} s ({frames_per_second:.1f} frames/sec)")
+    return frames_per_second
+
+def main():
     polygon_start = generate_polygon_vertices(POLYGON_START_VERTICES)
     polygon_end = generate_polygon_vertices(POLYGON_END_VERTICES)
 
     morph_polygon(polygon_start, polygon_end, PARAMETRIC_INTERPOLATION_STEPS)
 
+# `python 1d.py --render` writes the morph to ANIMATION_NAME without opening a window
+def render_main():
+    polygon_start = generate_polygon_vertices(POLYGON_START_VERTICES)
+    polygon_end = generate_polygon_vertices(POLYGON_END_VERTICES)
+
+    frames = morph_frames(polygon_start, polygon_end, PARAMETRIC_INTERPOLATION_STEPS)
+    render_morph_animation(frames, ANIMATION_NAME, fps=2)
+
 if __name__ == "__main__":
-    main()
+    if "--render" in sys.argv[1:]:
+        render_main()
+    else:
+        main()
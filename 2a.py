@@ -1,10 +1,13 @@
-import math
+import sys
+import time
 import matplotlib.pyplot as plt
 from PIL import Image
 import numpy as np
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+from typing import List, Tuple
 
-# using a 100x100 px image for faster calculation)
 IMAGE_PATH = './img.png'
 
 def read_grayscale_image() -> np.ndarray:
@@ -15,51 +18,391 @@ def read_grayscale_image() -> np.ndarray:
     except FileNotFoundError:
         raise FileNotFoundError(f"Error: Unable to load image at '{IMAGE_PATH}'")
 
-def dft(input_list: List[complex], inverse: bool = False) -> List[complex]:
-    N = len(input_list)
-    output_list = [0.0j for _ in range(N)]
+# prime lengths up to this size are transformed with a direct butterfly matrix,
+# bigger prime lengths go through bluestein chirp-z
+MAX_DIRECT_RADIX = 7
+# number of per-length plans kept alive, keyed on (length, direction, dtype)
+PLAN_CACHE_SIZE = 64
 
-    sign = -1 if inverse else 1
+def smallest_prime_factor(n: int) -> int:
+    if n % 2 == 0:
+        return 2
+    factor = 3
+    while factor * factor <= n:
+        if n % factor == 0:
+            return factor
+        factor += 2
+    return n
 
-    for k in range(N):
-        sum_value = 0.0 + 0.0j
+# radices in the order the length is split (outermost stage first), radix 4 is preferred over 2 * 2
+def factorize_length(n: int) -> List[int]:
+    factors = []
+    while n > 1:
+        radix = 4 if n % 4 == 0 else smallest_prime_factor(n)
+        factors.append(radix)
+        n //= radix
+    return factors
 
-        for n in range(N):
-            angle = 2 * math.pi * k * n / N
-            sum_value += input_list[n] * (math.cos(angle) + sign * 1j * math.sin(angle))
+def butterfly_matrix(n: int, sign: int) -> np.ndarray:
+    k = np.arange(n)
+    return np.exp(sign * 2j * np.pi * (np.outer(k, k) % n) / n)
 
-        if inverse:
-            sum_value /= N
+# generalized bit reversal: the order in which decimation in time leaves the input samples
+def digit_reversal_permutation(n: int, factors: List[int]) -> np.ndarray:
+    indices = np.arange(n).reshape(1, n)
+    for radix in factors:
+        rows, length = indices.shape
+        indices = indices.reshape(rows, length // radix, radix).swapaxes(1, 2).reshape(rows * radix, length // radix)
+    return indices.reshape(n)
 
-        output_list[k] = sum_value
+# single precision input keeps single precision, everything else (including uint8 images) is complex128
+def complex_dtype(dtype: np.dtype) -> np.dtype:
+    if np.dtype(dtype) in (np.float16, np.float32, np.complex64):
+        return np.dtype(np.complex64)
+    return np.dtype(np.complex128)
 
-    return output_list
+class FFTLengthPlan:
+    def __init__(self, length: int, inverse: bool = False, dtype: np.dtype = np.complex128):
+        self.length = length
+        self.inverse = inverse
+        self.dtype = np.dtype(dtype)
+        sign = 1 if inverse else -1
+        # inverse transforms fold the 1/N normalization into the last stage
+        scale = 1 / length if inverse else 1
 
-def dft2d(matrix: List[List[complex]], inverse: bool = False) -> List[List[complex]]:
-    rows, cols = len(matrix), len(matrix[0])
-    result_matrix = [[0.0j for _ in range(cols)] for _ in range(rows)]
+        factors = factorize_length(length)
+        self.bluestein = any(f > MAX_DIRECT_RADIX and f != 4 for f in factors)
 
-    # perform DFT on columns
-    for j in range(cols):
-        column_data = [matrix[i][j] for i in range(rows)]
-        transformed_col = dft(column_data, inverse)
-        for i in range(rows):
-            result_matrix[i][j] = transformed_col[i]
+        if self.bluestein:
+            self.init_bluestein(sign, scale)
+            return
 
-    # perform DFT on rows
-    for i in range(rows):
-        result_matrix[i] = dft(result_matrix[i], inverse)
+        self.permutation = digit_reversal_permutation(length, factors)
 
-    return result_matrix
+        # stages run innermost first, m is the length of the already transformed sub blocks
+        self.stages = []
+        m = 1
+        for radix in reversed(factors):
+            twiddles = np.exp(sign * 2j * np.pi * np.outer(np.arange(radix), np.arange(m)) / (radix * m))
+            butterfly = butterfly_matrix(radix, sign)
+            if radix * m == length:
+                butterfly = butterfly * scale
+            self.stages.append((radix, m, twiddles.astype(self.dtype), butterfly.astype(self.dtype)))
+            m *= radix
+
+    # https://en.wikipedia.org/wiki/Chirp_Z-transform#Bluestein's_algorithm
+    def init_bluestein(self, sign: int, scale: float) -> None:
+        n = self.length
+        m = 1 << (2 * n - 2).bit_length()  # power of two >= 2n - 1
+
+        k = np.arange(n)
+        chirp = np.exp(sign * 1j * np.pi * ((k * k) % (2 * n)) / n)
+
+        b = np.zeros(m, dtype=complex)
+        b[:n] = np.conj(chirp)
+        b[m - n + 1:] = np.conj(chirp[1:])[::-1]
+
+        self.padded_length = m
+        self.chirp = chirp.astype(self.dtype)
+        self.output_chirp = (chirp * scale).astype(self.dtype)
+        self.forward_plan = get_fft_plan(m, False, self.dtype)
+        self.inverse_plan = get_fft_plan(m, True, self.dtype)
+        self.chirp_spectrum = self.forward_plan.execute(b.astype(self.dtype))
+
+    # transform along the last axis
+    def execute(self, data: np.ndarray) -> np.ndarray:
+        data = np.asarray(data, dtype=self.dtype)
+        if data.shape[-1] != self.length:
+            raise ValueError(f"Expected last axis of length {self.length}, got {data.shape[-1]}")
+
+        if self.bluestein:
+            padded = np.zeros(data.shape[:-1] + (self.padded_length,), dtype=self.dtype)
+            padded[..., :self.length] = data * self.chirp
+            convolution = self.inverse_plan.execute(self.forward_plan.execute(padded) * self.chirp_spectrum)
+            return convolution[..., :self.length] * self.output_chirp
+
+        lead_shape = data.shape[:-1]
+        result = data[..., self.permutation]
+        for radix, m, twiddles, butterfly in self.stages:
+            blocks = result.reshape(lead_shape + (self.length // (radix * m), radix, m))
+            result = (butterfly @ (blocks * twiddles)).reshape(lead_shape + (self.length,))
+
+        return result
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def get_fft_plan(length: int, inverse: bool, dtype: np.dtype) -> FFTLengthPlan:
+    return FFTLengthPlan(length, inverse, dtype)
+
+# plan once for a fixed shape and direction, execute on many same-sized arrays;
+# the trailing len(shape) axes are transformed, leading axes are treated as a batch
+class FFTPlan:
+    def __init__(self, shape: Tuple[int, ...], inverse: bool = False, dtype: np.dtype = np.complex128):
+        self.shape = tuple(shape)
+        self.inverse = inverse
+        self.dtype = complex_dtype(dtype)
+        self.axis_plans = [get_fft_plan(n, inverse, self.dtype) for n in self.shape]
+
+    def execute(self, data: np.ndarray) -> np.ndarray:
+        result = np.asarray(data, dtype=self.dtype)
+        if result.shape[result.ndim - len(self.shape):] != self.shape:
+            raise ValueError(f"Expected trailing shape {self.shape}, got {result.shape}")
+
+        # first axis (columns) first, last axis (rows) last
+        first_axis = result.ndim - len(self.shape)
+        for offset, plan in enumerate(self.axis_plans):
+            axis = first_axis + offset
+            result = np.moveaxis(plan.execute(np.moveaxis(result, axis, -1)), -1, axis)
+
+        return result
+
+    __call__ = execute
+
+def real_dtype(dtype: np.dtype) -> np.dtype:
+    return np.dtype(np.float32) if complex_dtype(dtype) == np.complex64 else np.dtype(np.float64)
+
+# transform of real (..., rows, cols) data that only keeps the non-redundant
+# (..., rows, cols // 2 + 1) half of the hermitian symmetric spectrum;
+# shape is always the real shape, for both directions
+class RealFFTPlan:
+    def __init__(self, shape: Tuple[int, int], inverse: bool = False, dtype: np.dtype = np.float64):
+        self.shape = tuple(shape)
+        self.inverse = inverse
+        self.dtype = complex_dtype(dtype)
+        self.real_dtype = real_dtype(self.dtype)
+
+        rows, cols = self.shape
+        self.half_cols = cols // 2 + 1
+        self.column_plan = get_fft_plan(rows, inverse, self.dtype)
+
+        # even widths pack sample pairs into one complex value and run a half length transform
+        self.packed = cols % 2 == 0
+        if self.packed:
+            half = cols // 2
+            k = np.arange(self.half_cols)
+            sign = 1 if inverse else -1
+            self.row_plan = get_fft_plan(half, inverse, self.dtype)
+            self.twiddles = np.exp(sign * 2j * np.pi * k / cols).astype(self.dtype)
+            self.wrapped = k % half
+            self.mirrored = (-k) % half
+        else:
+            self.row_plan = get_fft_plan(cols, inverse, self.dtype)
+
+    def execute(self, data: np.ndarray) -> np.ndarray:
+        if self.inverse:
+            return self.execute_inverse(data)
+
+        data = np.asarray(data, dtype=self.real_dtype)
+        if data.shape[-2:] != self.shape:
+            raise ValueError(f"Expected trailing shape {self.shape}, got {data.shape}")
+
+        if self.packed:
+            packed = np.empty(data.shape[:-1] + (self.shape[1] // 2,), dtype=self.dtype)
+            packed.real = data[..., 0::2]
+            packed.imag = data[..., 1::2]
+            spectrum = self.row_plan.execute(packed)
+
+            # split the packed spectrum into the even and odd sample spectra
+            current = spectrum[..., self.wrapped]
+            mirrored = np.conj(spectrum[..., self.mirrored])
+            even = (current + mirrored) / 2
+            odd = (current - mirrored) / 2j
+            half_spectrum = even + self.twiddles * odd
+        else:
+            half_spectrum = self.row_plan.execute(data)[..., :self.half_cols]
+
+        return np.moveaxis(self.column_plan.execute(np.moveaxis(half_spectrum, -2, -1)), -1, -2)
+
+    def execute_inverse(self, half_spectrum: np.ndarray) -> np.ndarray:
+        half_spectrum = np.asarray(half_spectrum, dtype=self.dtype)
+        expected_shape = (self.shape[0], self.half_cols)
+        if half_spectrum.shape[-2:] != expected_shape:
+            raise ValueError(f"Expected trailing shape {expected_shape}, got {half_spectrum.shape}")
+
+        rows_spectrum = np.moveaxis(self.column_plan.execute(np.moveaxis(half_spectrum, -2, -1)), -1, -2)
+
+        # every row is now the half spectrum of a real row; like np.fft.irfft, the imaginary
+        # parts of the DC and (even widths) Nyquist bins don't belong to one and are dropped
+        if self.packed:
+            rows_spectrum[..., 0].imag = 0
+            rows_spectrum[..., self.half_cols - 1].imag = 0
+        mirrored = np.conj(rows_spectrum[..., self.half_cols - 1:0:-1])
+
+        if not self.packed:
+            full_spectrum = np.concatenate([rows_spectrum, mirrored], axis=-1)
+            return self.row_plan.execute(full_spectrum).real.astype(self.real_dtype)
+
+        half = self.shape[1] // 2
+        current = rows_spectrum[..., :half]
+        even = (current + mirrored) / 2
+        odd = (current - mirrored) * self.twiddles[:half] / 2
+        packed = self.row_plan.execute(even + 1j * odd)
+
+        result = np.empty(half_spectrum.shape[:-1] + (self.shape[1],), dtype=self.real_dtype)
+        result[..., 0::2] = packed.real
+        result[..., 1::2] = packed.imag
+        return result
+
+    __call__ = execute
+
+def dft(input_list: List[complex] | np.ndarray, inverse: bool = False) -> np.ndarray:
+    data = np.asarray(input_list)
+    return FFTPlan(data.shape[-1:], inverse, data.dtype).execute(data)
+
+def dft2d(matrix: List[List[complex]] | np.ndarray, inverse: bool = False) -> np.ndarray:
+    data = np.asarray(matrix)
+    return FFTPlan(data.shape, inverse, data.dtype).execute(data)
+
+def rdft2d(matrix: List[List[float]] | np.ndarray) -> np.ndarray:
+    data = np.asarray(matrix)
+    return RealFFTPlan(data.shape, False, data.dtype).execute(data)
+
+# cols defaults to an even width, like np.fft.irfft2
+def irdft2d(half_spectrum: np.ndarray, cols: int | None = None) -> np.ndarray:
+    half_spectrum = np.asarray(half_spectrum)
+    rows, half_cols = half_spectrum.shape
+    if cols is None:
+        cols = 2 * (half_cols - 1)
+    return RealFFTPlan((rows, cols), True, half_spectrum.dtype).execute(half_spectrum)
+
+# |X[r, c]| == |X[-r, -c]| for real input, so the right half of the magnitude
+# spectrum is mirrored from the stored half instead of being transformed
+def magnitude_from_half_spectrum(half_spectrum: np.ndarray, cols: int) -> np.ndarray:
+    half_magnitude = np.abs(half_spectrum)
+    rows, half_cols = half_magnitude.shape
+
+    magnitude = np.empty((rows, cols), dtype=half_magnitude.dtype)
+    magnitude[:, :half_cols] = half_magnitude
+    mirrored_rows = (-np.arange(rows)) % rows
+    mirrored_cols = cols - np.arange(half_cols, cols)
+    magnitude[:, half_cols:] = half_magnitude[mirrored_rows][:, mirrored_cols]
+
+    return magnitude
+
+# a column pass over the whole stack at once, then a row pass, all frames vectorized together;
+# with workers > 1 the work is split over a process pool that shares one buffer,
+# split='batch' hands each worker whole frames, split='passes' hands each worker
+# column blocks and then row blocks (useful when there are fewer frames than workers)
+def dft2d_batch(
+    stack: np.ndarray,
+    inverse: bool = False,
+    workers: int = 1,
+    split: str = 'batch',
+    executor: ProcessPoolExecutor | None = None
+) -> np.ndarray:
+    stack = np.asarray(stack)
+    if stack.ndim != 3:
+        raise ValueError(f"Expected a (B, H, W) stack, got shape {stack.shape}")
+    if split not in ('batch', 'passes'):
+        raise ValueError("split must be 'batch' or 'passes'")
+
+    dtype = complex_dtype(stack.dtype)
+    if workers <= 1 and executor is None:
+        return FFTPlan(stack.shape[1:], inverse, dtype).execute(stack)
+
+    shared = shared_memory.SharedMemory(create=True, size=stack.size * dtype.itemsize)
+    buffer = np.ndarray(stack.shape, dtype=dtype, buffer=shared.buf)
+    own_executor = executor is None
+
+    try:
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        buffer[...] = stack
+
+        if split == 'batch':
+            passes = [(0, stack.shape[0])]
+        else:
+            passes = [(2, stack.shape[2]), (1, stack.shape[1])]
+
+        # axis 0 blocks run the full 2d transform, axis 2 / axis 1 blocks run the column / row pass
+        for axis, length in passes:
+            bounds = np.linspace(0, length, min(workers, length) + 1).astype(int)
+            futures = [
+                executor.submit(transform_shared_block, shared.name, stack.shape, dtype.str, inverse, axis, start, stop)
+                for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+            ]
+            for future in futures:
+                future.result()
+
+        return buffer.copy()
+    finally:
+        del buffer
+        if own_executor and executor is not None:
+            executor.shutdown()
+        shared.close()
+        shared.unlink()
+
+def transform_shared_block(
+    name: str,
+    shape: Tuple[int, int, int],
+    dtype: str,
+    inverse: bool,
+    axis: int,
+    start: int,
+    stop: int
+) -> None:
+    shared = shared_memory.SharedMemory(name=name)
+    try:
+        buffer = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shared.buf)
+        if axis == 0:
+            block = buffer[start:stop]
+            block[...] = FFTPlan(shape[1:], inverse, block.dtype).execute(block)
+        elif axis == 2:
+            block = buffer[:, :, start:stop]
+            plan = get_fft_plan(shape[1], inverse, block.dtype)
+            block[...] = np.moveaxis(plan.execute(np.moveaxis(block, 1, -1)), -1, 1)
+        else:
+            block = buffer[:, start:stop, :]
+            block[...] = get_fft_plan(shape[2], inverse, block.dtype).execute(block)
+        del block, buffer
+    finally:
+        shared.close()
+
+# frames/sec of dft2d_batch for each (size, worker count), run with `python 2a.py --benchmark`
+def benchmark_batched_dft2d(
+    sizes: Tuple[int, ...] = (256, 1024, 4096),
+    worker_counts: Tuple[int, ...] = (1, 2, 4, 8),
+    repeats: int = 2
+) -> List[Tuple[int, int, float]]:
+    results = []
+    rng = np.random.default_rng(0)
+
+    for size in sizes:
+        # roughly the same amount of pixels per measurement for every size
+        frames = max(1, (2048 * 2048) // (size * size))
+        stack = rng.integers(0, 256, (frames, size, size), dtype=np.uint8)
+
+        for workers in worker_counts:
+            split = 'batch' if frames >= workers else 'passes'
+            executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+            try:
+                dft2d_batch(stack[:1], workers=workers, split=split, executor=executor)  # warm up plans and pool
+
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    dft2d_batch(stack, workers=workers, split=split, executor=executor)
+                elapsed = time.perf_counter() - start
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+            frames_per_second = frames * repeats / elapsed
+            results.append((size, workers, frames_per_second))
+            print(f"{size}x{size}  frames={frames:<3} workers={workers:<2} split={split:<7} {frames_per_second:10.2f} frames/sec")
+
+    return results
 
 def main() -> None:
     grayscale_image = read_grayscale_image()
 
-    dft_matrix = dft2d(grayscale_image)
-    magnitude_spectrum_dft = np.log(1 + np.abs(dft_matrix))
+    # the image is real, so only the half spectrum is computed and stored
+    forward_plan = RealFFTPlan(grayscale_image.shape)
+    inverse_plan = RealFFTPlan(grayscale_image.shape, inverse=True)
+
+    half_dft_matrix = forward_plan.execute(grayscale_image)
+    magnitude_spectrum_dft = np.log(1 + magnitude_from_half_spectrum(half_dft_matrix, grayscale_image.shape[1]))
 
-    idft_matrix = dft2d(dft_matrix, inverse=True)
-    reconstructed_image_dft = np.real(np.array(idft_matrix)).astype(np.uint8)
+    idft_matrix = inverse_plan.execute(half_dft_matrix)
+    reconstructed_image_dft = idft_matrix.astype(np.uint8)
 
     # Comparing results to built in FFT and IFFT
     fft_matrix = np.fft.fft2(grayscale_image)
@@ -91,4 +434,7 @@ def main() -> None:
     plt.show()
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv[1:]:
+        benchmark_batched_dft2d()
+    else:
+        main()
@@ -1,11 +1,20 @@
+import bisect
+import math
+import sys
+import time
+import numpy as np
 from PIL import Image
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Sequence, Tuple
 
 IMAGE_WIDTH = 400
 IMAGE_HEIGHT = 400
 BACKGROUND_COLOR = (255, 255, 255)
 PIXEL_COLOR = (0, 0, 0)
 IMAGE_NAME = "polygon_fill.png"
+FILL_RULES = ("even-odd", "non-zero")
+TILE_SIZE = 256
 
 PENTAGON: List[Tuple[int, int]] = [
     (30, 60),
@@ -42,108 +51,325 @@ def edges_from_polygon(polygon: List[Tuple[int, int]]) -> List[Tuple[Tuple[int,
         edges.append((start, end))
     return edges
 
-def bubble_sort_polygon_edges(polygon_edges: List[Tuple[Tuple[int, int], Tuple[int, int]]], sort_by: str = 'y') -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
-    edge_count = len(polygon_edges)
+# global edge table: non-horizontal edges bucketed by the first scanline they cross (horizontal
+# edges are skipped, the edges meeting them already bound the span); an entry is
+# [x, x_remainder, y_end, x_step, x_step_remainder, dy, winding]: the crossing is at
+# x + x_remainder / dy and moves by x_step + x_step_remainder / dy per scanline, which keeps
+# integer vertices exact without a division per scanline, other vertices step in floating
+# point with dy = 1; winding is +1 for edges running down the screen and -1 for edges running up
+def build_edge_table(polygon: List[Tuple[int, int]], y_start: int | None = None) -> Dict[int, List[List[float]]]:
+    edge_table = {}
 
-    for i in range(edge_count):
-        swapped = False
+    for (x0, y0), (x1, y1) in edges_from_polygon(polygon):
+        if y0 == y1:
+            continue
+        winding = 1
+        if y0 > y1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+            winding = -1
 
-        for j in range(edge_count - i - 1):
-            current_edge = polygon_edges[j]
-            next_edge = polygon_edges[j + 1]
+        # edges reaching above y_start enter on y_start with their crossing computed there
+        first_row = math.ceil(y0)
+        if y_start is not None and y_start > first_row:
+            first_row = y_start
+        if first_row >= y1:
+            continue
 
-            if sort_by == 'x':
-                current_key = min(current_edge[0][0], current_edge[1][0])
-                next_key = min(next_edge[0][0], next_edge[1][0])
-            elif sort_by == 'y':
-                current_key = min(current_edge[0][1], current_edge[1][1])
-                next_key = min(next_edge[0][1], next_edge[1][1])
-            else:
-                raise ValueError("sort_by must be 'x' or 'y'")
+        if all(isinstance(value, int) for value in (x0, y0, x1, y1)):
+            dy = y1 - y0
+            x_start, x_remainder = divmod(x0 * dy + (first_row - y0) * (x1 - x0), dy)
+            x_step, x_step_remainder = divmod(x1 - x0, dy)
+            edge_table.setdefault(first_row, []).append([x_start, x_remainder, y1, x_step, x_step_remainder, dy, winding])
+            continue
 
-            if current_key > next_key:
-                polygon_edges[j], polygon_edges[j + 1] = polygon_edges[j + 1], polygon_edges[j]
-                swapped = True
+        inverse_slope = (x1 - x0) / (y1 - y0)
+        x_start = x0 + (first_row - y0) * inverse_slope
+        edge_table.setdefault(first_row, []).append([x_start, 0, y1, inverse_slope, 0, 1, winding])
 
-        if not swapped:
-            break
+    return edge_table
 
-    return polygon_edges
+def active_edge_key(edge: List[float]) -> Tuple[float, float]:
+    return edge[0] + edge[1] / edge[5], edge[3] + edge[4] / edge[5]
 
-def line_intersect(edge: Tuple[Tuple[int, int], Tuple[int, int]], y: int) -> float:
-    (x0, y0), (x1, y1) = edge
+# nearest pixel column of the crossing, halves round to even like round()
+def edge_pixel_x(edge: List[float]) -> int:
+    x, remainder, dy = edge[0], edge[1], edge[5]
+    if 2 * remainder < dy:
+        return int(round(x))
+    if 2 * remainder > dy or x % 2 == 1:
+        return int(x) + 1
+    return int(x)
 
-    if y0 == y1:
-        return None
-    
-    t = (y - y0) / (y1 - y0)
-    x_intersect = x0 + t * (x1 - x0)
-    return x_intersect
+# crossings of one scanline (sorted by x) paired into inside runs: even-odd toggles at every
+# crossing, non-zero is inside while the summed winding of the crossings so far is not zero
+def scanline_runs(active_edges: List[List[float]], fill_rule: str) -> Iterator[Tuple[List[float], List[float]]]:
+    if fill_rule == "even-odd":
+        yield from zip(active_edges[0::2], active_edges[1::2])
+        return
 
-def fill_polygon(polygon: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
-    filled_pixels = []
-    
-    polygon_edges = edges_from_polygon(polygon)
-    polygon_edges = bubble_sort_polygon_edges(polygon_edges, sort_by='y')
-    
-    y_min = int(min(y for (_, y) in polygon))
-    y_max = int(max(y for (_, y) in polygon))
-    
-    active_edges = []
+    winding = 0
+    for edge in active_edges:
+        if winding == 0:
+            left = edge
+        winding += edge[6]
+        if winding == 0:
+            yield left, edge
 
-    for y_level in range(y_min, y_max + 1):
+# scanline fill with an active edge table: edges enter from the edge table on their first
+# scanline (sorted insertion), leave once the scanline reaches their upper end and their
+# x is stepped incrementally, spans (y, x_start, x_end) with x_end inclusive run between
+# crossings by the fill rule, scanlines outside [y_start, y_stop) are never walked
+def polygon_spans(polygon: List[Tuple[int, int]], y_start: int | None = None,
+                  y_stop: int | None = None, fill_rule: str = "even-odd") -> Iterator[Tuple[int, int, int]]:
+    if fill_rule not in FILL_RULES:
+        raise ValueError(f"Unknown fill rule {fill_rule!r}, expected one of {FILL_RULES}")
 
-        for edge in polygon_edges:
-            (_, y0), (_, y1) = edge
+    edge_table = build_edge_table(polygon, y_start)
+    if not edge_table:
+        return
 
-            edge_y_min = min(y0,y1)
+    y_min = min(edge_table)
+    y_max = math.ceil(max(edge[2] for edges in edge_table.values() for edge in edges))
+    if y_stop is not None and y_stop < y_max:
+        y_max = y_stop
+
+    active_edges = []
 
-            if y_level == edge_y_min:
-                active_edges.append(edge)
+    for y_level in range(y_min, y_max):
+        for edge in edge_table.get(y_level, ()):
+            bisect.insort(active_edges, edge, key=active_edge_key)
 
-        active_edges = [edge for edge in active_edges if max(edge[0][1], edge[1][1]) > y_level]
+        active_edges = [edge for edge in active_edges if edge[2] > y_level]
+
+        for left, right in scanline_runs(active_edges, fill_rule):
+            yield y_level, edge_pixel_x(left), edge_pixel_x(right)
 
-        intersections = []
         for edge in active_edges:
-            (x0, y0), (x1, y1) = edge
-
-            if y0 == y1: 
-                x_left = min(x0, x1)
-                x_right = max(x0, x1)
-                for x in range(int(round(x_left)), int(round(x_right)) + 1):
-                    filled_pixels.append((x, y_level))
-            else: 
-                x_intersection = line_intersect(edge, y_level)
-                if x_intersection is not None:
-                    intersections.append((x_intersection, y_level))
-
-        intersections.sort(key=lambda point: point[0])
-
-        while len(intersections) > 1:
-            x_left, _ = intersections.pop(0)  
-            x_right, _ = intersections.pop(0)  
-        
-            for x in range(int(round(x_left)), int(round(x_right)) + 1):
-                filled_pixels.append((x, y_level))
+            edge[0] += edge[3]
+            edge[1] += edge[4]
+            if edge[1] >= edge[5]:
+                edge[0] += 1
+                edge[1] -= edge[5]
+
+        # already almost sorted, only crossing edges swap places
+        active_edges.sort(key=active_edge_key)
+
+# list of (x, y) pixels, kept for callers of the old per-pixel api
+def fill_polygon(polygon: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    filled_pixels = []
+
+    for y_level, x_start, x_end in polygon_spans(polygon):
+        for x in range(x_start, x_end + 1):
+            filled_pixels.append((x, y_level))
 
     return filled_pixels
 
-def show_polygon_fill(filled_pixels: List[Tuple[int, int]]) -> None:
-    image = Image.new("RGB", (IMAGE_WIDTH, IMAGE_HEIGHT), BACKGROUND_COLOR)
+# height x width x 4 uint8 (rgba, opaque) for colour tuples, height x width for a single value
+def create_framebuffer(width: int, height: int, color: int | Tuple[int, ...] = BACKGROUND_COLOR) -> np.ndarray:
+    if isinstance(color, int):
+        return np.full((height, width), color, dtype=np.uint8)
+    return np.full((height, width, 4), framebuffer_color(color), dtype=np.uint8)
+
+def framebuffer_color(color: int | Tuple[int, ...]) -> int | Tuple[int, ...]:
+    if isinstance(color, int) or len(color) == 4:
+        return color
+    return (*color, 255)
+
+# rows are clipped to the framebuffer before the edge walk, spans are clipped per row and
+# written with one slice assignment each; origin is the canvas position of the framebuffer's
+# top-left pixel, so a tile view of a larger canvas can be filled in canvas coordinates
+def fill_polygon_into(framebuffer: np.ndarray, polygon: List[Tuple[int, int]],
+                      color: int | Tuple[int, ...] = PIXEL_COLOR, fill_rule: str = "even-odd",
+                      origin: Tuple[int, int] = (0, 0)) -> np.ndarray:
+    height, width = framebuffer.shape[:2]
+    x_origin, y_origin = origin
+    color = framebuffer_color(color) if framebuffer.ndim == 3 else color
+
+    for y_level, x_start, x_end in polygon_spans(polygon, y_origin, y_origin + height, fill_rule):
+        x_start = max(x_start - x_origin, 0)
+        x_end = min(x_end - x_origin, width - 1)
+        if x_start <= x_end:
+            framebuffer[y_level - y_origin, x_start:x_end + 1] = color
+
+    return framebuffer
+
+# pixel box (x_min, y_min, x_max, y_max) a polygon can touch, inclusive and a little loose
+def polygon_bounds(polygon: List[Tuple[int, int]]) -> Tuple[int, int, int, int]:
+    xs = [x for x, _ in polygon]
+    ys = [y for _, y in polygon]
+    return math.floor(min(xs)), math.floor(min(ys)), math.ceil(max(xs)), math.ceil(max(ys))
+
+# tile (column, row) -> indices of the polygons whose bounds overlap it, in input order;
+# polygons entirely outside the canvas land in no tile and are never rasterized
+def bin_polygons(polygons: Sequence[List[Tuple[int, int]]], width: int, height: int,
+                 tile_size: int = TILE_SIZE) -> Dict[Tuple[int, int], List[int]]:
+    tiles = {}
+    last_column = (width - 1) // tile_size
+    last_row = (height - 1) // tile_size
 
-    pixels = image.load()
+    for index, polygon in enumerate(polygons):
+        if len(polygon) < 3:
+            continue
+        x_min, y_min, x_max, y_max = polygon_bounds(polygon)
+        if x_max < 0 or y_max < 0 or x_min >= width or y_min >= height:
+            continue
+        for row in range(max(y_min, 0) // tile_size, min(y_max // tile_size, last_row) + 1):
+            for column in range(max(x_min, 0) // tile_size, min(x_max // tile_size, last_column) + 1):
+                tiles.setdefault((column, row), []).append(index)
 
-    for x, y in filled_pixels:
-        if 0 <= x < IMAGE_WIDTH and 0 <= y < IMAGE_HEIGHT:
-            pixels[x, y] = PIXEL_COLOR
+    return tiles
+
+# label ids get the smallest unsigned type that holds them, colour tuples an rgba framebuffer
+def batch_framebuffer(width: int, height: int, values: Sequence[int | Tuple[int, ...]],
+                      background: int | Tuple[int, ...]) -> np.ndarray:
+    if isinstance(background, int):
+        largest = max([background, *values])
+        dtype = np.uint8 if largest <= 0xFF else np.uint16 if largest <= 0xFFFF else np.uint32
+        return np.full((height, width), background, dtype=dtype)
+    return np.full((height, width, 4), framebuffer_color(background), dtype=np.uint8)
+
+def tile_region(tile: Tuple[int, int], width: int, height: int, tile_size: int) -> Tuple[int, int, int, int]:
+    column, row = tile
+    x_start, y_start = column * tile_size, row * tile_size
+    return x_start, y_start, min(x_start + tile_size, width), min(y_start + tile_size, height)
+
+def rasterize_tile(framebuffer: np.ndarray, region: Tuple[int, int, int, int],
+                   polygons: List[List[Tuple[int, int]]], values: List[int | Tuple[int, ...]],
+                   fill_rule: str) -> None:
+    x_start, y_start, x_stop, y_stop = region
+    tile = framebuffer[y_start:y_stop, x_start:x_stop]
+    for polygon, value in zip(polygons, values):
+        fill_polygon_into(tile, polygon, value, fill_rule, (x_start, y_start))
+
+def rasterize_shared_tile(
+    name: str,
+    shape: Tuple[int, ...],
+    dtype: str,
+    region: Tuple[int, int, int, int],
+    polygons: List[List[Tuple[int, int]]],
+    values: List[int | Tuple[int, ...]],
+    fill_rule: str
+) -> None:
+    shared = shared_memory.SharedMemory(name=name)
+    try:
+        framebuffer = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shared.buf)
+        rasterize_tile(framebuffer, region, polygons, values, fill_rule)
+        del framebuffer
+    finally:
+        shared.close()
+
+# many polygons into one canvas, values[i] is the label id or colour of polygons[i];
+# overlaps resolve in input order (later polygons paint over earlier ones) inside every tile,
+# and tiles never share pixels, so worker count and scheduling do not change the result;
+# with workers > 1 tiles are rasterized by a process pool into one shared framebuffer
+def rasterize_polygons(
+    polygons: Sequence[List[Tuple[int, int]]],
+    values: Sequence[int | Tuple[int, ...]],
+    width: int,
+    height: int,
+    fill_rule: str = "even-odd",
+    background: int | Tuple[int, ...] = 0,
+    tile_size: int = TILE_SIZE,
+    workers: int = 1,
+    executor: ProcessPoolExecutor | None = None
+) -> np.ndarray:
+    if len(polygons) != len(values):
+        raise ValueError(f"Got {len(polygons)} polygons but {len(values)} values")
+    if fill_rule not in FILL_RULES:
+        raise ValueError(f"Unknown fill rule {fill_rule!r}, expected one of {FILL_RULES}")
+
+    framebuffer = batch_framebuffer(width, height, values, background)
+    tiles = bin_polygons(polygons, width, height, tile_size)
+
+    def tile_jobs():
+        for tile, indices in tiles.items():
+            region = tile_region(tile, width, height, tile_size)
+            yield region, [polygons[index] for index in indices], [values[index] for index in indices]
+
+    if workers <= 1 and executor is None:
+        for region, tile_polygons, tile_values in tile_jobs():
+            rasterize_tile(framebuffer, region, tile_polygons, tile_values, fill_rule)
+        return framebuffer
+
+    shared = shared_memory.SharedMemory(create=True, size=framebuffer.nbytes)
+    buffer = np.ndarray(framebuffer.shape, dtype=framebuffer.dtype, buffer=shared.buf)
+    own_executor = executor is None
+
+    try:
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        buffer[...] = framebuffer
+
+        futures = [
+            executor.submit(rasterize_shared_tile, shared.name, buffer.shape, buffer.dtype.str,
+                            region, tile_polygons, tile_values, fill_rule)
+            for region, tile_polygons, tile_values in tile_jobs()
+        ]
+        for future in futures:
+            future.result()
+
+        framebuffer[...] = buffer
+        return framebuffer
+    finally:
+        del buffer
+        if own_executor and executor is not None:
+            executor.shutdown()
+        shared.close()
+        shared.unlink()
+
+# shares memory with the framebuffer (pil only maps 1 and 4 byte pixel modes without a copy)
+def framebuffer_to_image(framebuffer: np.ndarray) -> Image.Image:
+    height, width = framebuffer.shape[:2]
+    mode = "L" if framebuffer.ndim == 2 else "RGBA"
+    return Image.frombuffer(mode, (width, height), np.ascontiguousarray(framebuffer), "raw", mode, 0, 1)
+
+def show_polygon_fill(framebuffer: np.ndarray) -> None:
+    image = framebuffer_to_image(framebuffer)
     image.save(IMAGE_NAME)
     image.show()
 
+# run with `python 3d.py --benchmark`
+def benchmark_polygon_batch(
+    size: Tuple[int, int] = (4096, 4096),
+    polygon_count: int = 20000,
+    worker_counts: Tuple[int, ...] = (1, 2, 4),
+    repeats: int = 3
+) -> None:
+    rng = np.random.default_rng(0)
+    width, height = size
+    # small star-shaped label regions scattered over (and a little past) the canvas
+    polygons = []
+    for _ in range(polygon_count):
+        count = int(rng.integers(3, 12))
+        angles = np.sort(rng.random(count)) * 2 * np.pi
+        radii = rng.uniform(5, 40, count)
+        x_center, y_center = rng.uniform(-50, width + 50), rng.uniform(-50, height + 50)
+        polygons.append([(int(x_center + r * math.cos(a)), int(y_center + r * math.sin(a)))
+                         for a, r in zip(angles, radii)])
+    labels = list(range(1, polygon_count + 1))
+
+    for workers in worker_counts:
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            rasterize_polygons(polygons[:workers], labels[:workers], width, height, workers=workers, executor=executor)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                rasterize_polygons(polygons, labels, width, height, workers=workers, executor=executor)
+            elapsed = (time.perf_counter() - start) / repeats
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        print(f"{polygon_count} polygons into {width}x{height} workers={workers}: {elapsed * 1000:.1f} ms")
+
 def main() -> None:
     polygon = TRIANGLE
 
-    filled_pixels = fill_polygon(polygon)
-    show_polygon_fill(filled_pixels)
+    framebuffer = create_framebuffer(IMAGE_WIDTH, IMAGE_HEIGHT)
+    fill_polygon_into(framebuffer, polygon)
+    show_polygon_fill(framebuffer)
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv[1:]:
+        benchmark_polygon_batch()
+    else:
+        main()
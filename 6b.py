@@ -1,6 +1,16 @@
 from matplotlib import pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+from PIL import Image
+import bisect
+import heapq
 import math
-from typing import List, Tuple
+import sys
+import time
+import numpy as np
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Sequence, Tuple
 
 # projection value
 D = 5.0  
@@ -13,36 +23,64 @@ STEP = (END_VAL - START_VAL) / (VAL_COUNT - 1)
 U_VALS = [START_VAL + i * STEP for i in range(VAL_COUNT)]
 V_VALS = [START_VAL + i * STEP for i in range(VAL_COUNT)]
 
-def flat_plane(u: float, v: float):
+# software wireframe rendering
+WIREFRAME_SIZE = (800, 800)
+WIREFRAME_MARGIN = 0.05  # fraction of the image left free around the mesh
+WIREFRAME_SHADES = (0, 180)  # gray level of the nearest and the farthest lines
+WIREFRAME_BACKGROUND = 255
+WIREFRAME_EDGE_CHUNK = 1 << 18  # edges rasterized per vectorized batch
+WIREFRAME_IMAGE_NAME = "wireframe.png"
+
+# adaptive tessellation
+ADAPTIVE_MAX_LEVEL = 12  # finest lattice is (2^level + 1)^2 (u, v) samples
+ADAPTIVE_MAX_TRIANGLES = 1 << 16
+ADAPTIVE_MIN_ERROR = 1e-4
+ADAPTIVE_PERIODIC_SPLITS = 4  # uniform bisection rounds of the base square on periodic surfaces
+LOD_LEVEL_RATIO = 2
+LOD_CACHE_SIZE = 16
+SEAM_SAMPLES = 17
+SEAM_TOLERANCE = 1e-9
+
+# mesh export
+EXPORT_CHUNK_ROWS = 256  # grid rows evaluated and written per chunk
+PLY_FACE_DTYPE = np.dtype([("count", "u1"), ("indices", "<i4", (3,))])
+
+# surfaces take u and v as floats or as arrays of the same shape (numpy functions work on both)
+def flat_plane(u, v):
     x = u
     y = v
-    z = 0.0  # all z-values are zero for a flat plane
+    z = np.zeros_like(u, dtype=float)  # all z-values are zero for a flat plane
     return x, y, z
 
-def sphere(u: float, v: float):
-    x = math.sin(u) * math.cos(v)
-    y = math.sin(u) * math.sin(v)
-    z = math.cos(u)
+def sphere(u, v):
+    x = np.sin(u) * np.cos(v)
+    y = np.sin(u) * np.sin(v)
+    z = np.cos(u)
     return x, y, z
 
-def torus(u: float, v: float):
+def torus(u, v):
     R = 1.0
     r = 0.3
-    x = (R + r * math.cos(v)) * math.cos(u)
-    y = (R + r * math.cos(v)) * math.sin(u)
-    z = r * math.sin(v)
+    x = (R + r * np.cos(v)) * np.cos(u)
+    y = (R + r * np.cos(v)) * np.sin(u)
+    z = r * np.sin(v)
     return x, y, z
 
-def generate_surface_grid(
-    surface_def, u_vals: List[float], v_vals: List[float]
-) -> List[List[Tuple[float, float, float]]]:
-    grid = []
-    for u in u_vals:
-        row = []
-        for v in v_vals:
-            row.append(surface_def(u, v))
-        grid.append(row)
-    return grid
+# (len(u_vals), len(v_vals), 3) array, grid[i, j] is the surface point at (u_vals[i], v_vals[j]);
+# the surface is called once with meshgrid arrays, surfaces written with scalar math
+# functions (which reject arrays) are evaluated point by point instead
+def generate_surface_grid(surface_def, u_vals: Sequence[float], v_vals: Sequence[float]) -> np.ndarray:
+    u_grid, v_grid = np.meshgrid(np.asarray(u_vals, dtype=float), np.asarray(v_vals, dtype=float), indexing="ij")
+
+    try:
+        components = surface_def(u_grid, v_grid)
+        # constant components (e.g. z = 0.0) broadcast over the grid
+        return np.stack(np.broadcast_arrays(*components, u_grid)[:3], axis=-1).astype(float)
+    except (TypeError, ValueError):
+        pass
+
+    scalar_surface = np.vectorize(surface_def, otypes=[float, float, float])
+    return np.stack(scalar_surface(u_grid, v_grid), axis=-1)
 
 def project_3d_point_to_2d(x: float, y: float, z: float, D: float) -> Tuple[float, float]:
     depth = z + D
@@ -53,24 +91,21 @@ def project_3d_point_to_2d(x: float, y: float, z: float, D: float) -> Tuple[floa
 
     return x_proj, y_proj
 
-def project_surface_to_2d(grid: List[List[Tuple[float, float, float]]], D: float) -> List[List[Tuple[float, float, float]]]:
-    rows = len(grid)
-    cols = len(grid[0])
+# same projection as project_3d_point_to_2d for the whole grid in one broadcast divide,
+# keeps z as the third coordinate
+def project_surface_to_2d(grid: np.ndarray, D: float) -> np.ndarray:
+    grid = np.asarray(grid, dtype=float)
+    depth = grid[..., 2] + D
+    depth[depth == 0] = 1e-5  # using 0.00001 to avoid zero dvisionm
 
-    projection_grid = []
-
-    for i in range(rows):
-        row = []
-        for j in range(cols):
-            x, y, z = grid[i][j]
-            x_proj, y_proj = project_3d_point_to_2d(x, y, z, D) 
-            row.append((x_proj, y_proj, z)) 
-        projection_grid.append(row)
+    projection_grid = np.empty_like(grid)
+    np.divide(grid[..., :2], depth[..., None], out=projection_grid[..., :2])
+    projection_grid[..., 2] = grid[..., 2]
 
     return projection_grid
 
 def create_triangle_mesh_from_projection_grid(
-    projection_grid: List[List[Tuple[float, float, float]]]
+    projection_grid: np.ndarray
 ) -> List[List[Tuple[float, float, float]]]:
     rows = len(projection_grid)
     cols = len(projection_grid[0])
@@ -89,30 +124,600 @@ def create_triangle_mesh_from_projection_grid(
 
     return triangles
 
-def plot_triangles_3d(triangles: List[Tuple[float, float, float]]) -> None:
-    fig = plt.figure(figsize=(8, 8))
-    ax = fig.add_subplot(111, projection="3d")
+# (T, 3) vertex indices of the triangulated grid with the same triangle order as
+# create_triangle_mesh_from_projection_grid, vertex (i, j) is index i * cols + j
+def grid_faces(rows: int, cols: int) -> np.ndarray:
+    index = np.arange(rows * cols, dtype=np.int32).reshape(rows, cols)
+    p1 = index[:-1, :-1]
+    p2 = index[1:, :-1]
+    p3 = index[:-1, 1:]
+    p4 = index[1:, 1:]
+
+    faces = np.stack([np.stack([p1, p2, p3], axis=-1), np.stack([p2, p4, p3], axis=-1)], axis=2)
+    return faces.reshape(-1, 3)
+
+# shared float32 (V, 3) vertex buffer and int32 (T, 3) face index buffer; edges and face
+# normals are derived on first access and cached
+class IndexedMesh:
+    __slots__ = ("vertices", "faces", "_edges", "_face_normals")
+
+    def __init__(self, vertices: np.ndarray, faces: np.ndarray):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, 3)
+        self.faces = np.ascontiguousarray(faces, dtype=np.int32).reshape(-1, 3)
+        self._edges = None
+        self._face_normals = None
+
+    @classmethod
+    def from_grid(cls, grid: np.ndarray) -> 'IndexedMesh':
+        grid = np.asarray(grid)
+        rows, cols = grid.shape[:2]
+        return cls(grid.reshape(-1, 3), grid_faces(rows, cols))
+
+    def __len__(self) -> int:
+        return len(self.faces)
+
+    @property
+    def nbytes(self) -> int:
+        cached = sum(array.nbytes for array in (self._edges, self._face_normals) if array is not None)
+        return self.vertices.nbytes + self.faces.nbytes + cached
+
+    # unique undirected (E, 2) int32 edges, lower vertex index first
+    @property
+    def edges(self) -> np.ndarray:
+        if self._edges is None:
+            starts = self.faces.astype(np.int64).ravel()
+            ends = self.faces[:, [1, 2, 0]].astype(np.int64).ravel()
+            # one int64 key per edge, sorted and deduplicated (much faster than unique rows)
+            keys = np.sort(np.minimum(starts, ends) * len(self.vertices) + np.maximum(starts, ends))
+            keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+            self._edges = np.stack(np.divmod(keys, len(self.vertices)), axis=1).astype(np.int32)
+        return self._edges
+
+    # (T, 3) unit normals from the face winding, zero for degenerate triangles
+    @property
+    def face_normals(self) -> np.ndarray:
+        if self._face_normals is None:
+            p1, p2, p3 = (self.vertices[self.faces[:, k]] for k in range(3))
+            normals = np.cross(p2 - p1, p3 - p1)
+            lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+            np.divide(normals, lengths, out=normals, where=lengths > 0)
+            normals[lengths[:, 0] == 0] = 0
+            self._face_normals = normals
+        return self._face_normals
+
+    # (T, 3, 3) vertex coordinates of every triangle, the layout plot_triangles_3d iterates over
+    def triangles(self) -> np.ndarray:
+        return self.vertices[self.faces]
+
+# adaptive tessellation: right triangles on a (2^ADAPTIVE_MAX_LEVEL + 1)^2 lattice over the (u, v)
+# range are bisected at the midpoint of their hypotenuse, worst error first; a triangle is only
+# split together with the neighbour across its hypotenuse (a coarser neighbour is split first),
+# so the mesh never has t-junctions; error is the distance between the surface and the
+# hypotenuse midpoint, the larger of the 3d and the projected distance
+class AdaptiveTessellator:
+    def __init__(self, surface_def, u_range: Tuple[float, float], v_range: Tuple[float, float], D: float):
+        self.surface_def = surface_def
+        self.u_range = u_range
+        self.v_range = v_range
+        self.D = D
+        self.size = 1 << ADAPTIVE_MAX_LEVEL
+        # lattice coordinates wrap where the surface closes on itself (torus, sphere), which
+        # welds the seam: triangles on both sides become neighbours and share vertices
+        # (a mask of size - 1 maps the last lattice line onto the first, -1 keeps every index)
+        self.u_mask = self.size - 1 if self.is_periodic(axis=0) else -1
+        self.v_mask = self.size - 1 if self.is_periodic(axis=1) else -1
+
+        self.points = {}  # wrapped lattice vertex -> (world xyz, projected xyz)
+        self.leaves = {}  # leaf triangle (apex, left, right) -> error of splitting it
+        self.edge_triangles = {}  # wrapped edge -> leaf triangles that have it
+        self.heap = []
+        self.counter = 0
+
+        n = self.size
+        # the square split along its diagonal, vertices counterclockwise in (u, v), hypotenuse last
+        self.add_triangle(((n, 0), (n, n), (0, 0)))
+        self.add_triangle(((0, n), (0, 0), (n, n)))
+
+        # across a seam the coarse triangles wrap onto the same lattice vertices, so different edges
+        # get the same wrapped key; after ADAPTIVE_PERIODIC_SPLITS uniform rounds every edge spans less
+        # than half a period and the wrapped keys are unique again (a round bisects every leaf, which
+        # keeps the mesh conforming without looking up neighbours)
+        if self.u_mask != -1 or self.v_mask != -1:
+            for _ in range(ADAPTIVE_PERIODIC_SPLITS):
+                for triangle in list(self.leaves):
+                    self.bisect(triangle)
+
+    def surface_point(self, u: float, v: float) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
+        x, y, z = (float(value) for value in self.surface_def(u, v))
+        x_proj, y_proj = project_3d_point_to_2d(x, y, z, self.D)
+        return (x, y, z), (x_proj, y_proj, z)
+
+    def parameters(self, vertex: Tuple[int, int]) -> Tuple[float, float]:
+        (u_start, u_end), (v_start, v_end) = self.u_range, self.v_range
+        return (u_start + (u_end - u_start) * vertex[0] / self.size,
+                v_start + (v_end - v_start) * vertex[1] / self.size)
+
+    def is_periodic(self, axis: int) -> bool:
+        samples = np.linspace(0, 1, SEAM_SAMPLES)
+        (u_start, u_end), (v_start, v_end) = self.u_range, self.v_range
+        for t in samples:
+            if axis == 0:
+                first, last = self.surface_point(u_start, v_start + t * (v_end - v_start)), self.surface_point(u_end, v_start + t * (v_end - v_start))
+            else:
+                first, last = self.surface_point(u_start + t * (u_end - u_start), v_start), self.surface_point(u_start + t * (u_end - u_start), v_end)
+            if math.dist(first[0], last[0]) > SEAM_TOLERANCE:
+                return False
+        return True
+
+    def wrap(self, vertex: Tuple[int, int]) -> Tuple[int, int]:
+        return vertex[0] & self.u_mask, vertex[1] & self.v_mask
+
+    def edge_key(self, a: Tuple[int, int], b: Tuple[int, int]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        a, b = self.wrap(a), self.wrap(b)
+        return (a, b) if a <= b else (b, a)
+
+    def point(self, vertex: Tuple[int, int]) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
+        key = self.wrap(vertex)
+        if key not in self.points:
+            self.points[key] = self.surface_point(*self.parameters(vertex))
+        return self.points[key]
+
+    def split_error(self, triangle) -> float:
+        _, left, right = triangle
+        if (left[0] + right[0]) % 2 or (left[1] + right[1]) % 2:
+            return 0.0  # hypotenuse already at lattice resolution
+        middle = ((left[0] + right[0]) // 2, (left[1] + right[1]) // 2)
+        surface = self.point(middle)
+        left_point, right_point = self.point(left), self.point(right)
+        return max(math.dist(surface[k], [(a + b) / 2 for a, b in zip(left_point[k], right_point[k])]) for k in range(2))
+
+    def add_triangle(self, triangle) -> None:
+        for k in range(3):
+            self.edge_triangles.setdefault(self.edge_key(triangle[k], triangle[(k + 1) % 3]), []).append(triangle)
+        self.point(triangle[0])
+        error = self.split_error(triangle)
+        self.leaves[triangle] = error
+        if error > 0:
+            heapq.heappush(self.heap, (-error, self.counter, triangle))
+            self.counter += 1
+
+    def remove_triangle(self, triangle) -> None:
+        del self.leaves[triangle]
+        for k in range(3):
+            key = self.edge_key(triangle[k], triangle[(k + 1) % 3])
+            self.edge_triangles[key].remove(triangle)
+            if not self.edge_triangles[key]:
+                del self.edge_triangles[key]
+
+    # edges along a border of the (u, v) range that doesn't wrap
+    def on_open_border(self, edge: Tuple[Tuple[int, int], Tuple[int, int]]) -> bool:
+        (a, b), n = edge, self.size
+        return ((self.u_mask == -1 and a[0] == b[0] and a[0] in (0, n))
+                or (self.v_mask == -1 and a[1] == b[1] and a[1] in (0, n)))
+
+    # every edge has to be shared by exactly two leaves (one on an open border, which nothing
+    # lies beyond), otherwise the mesh has a crack or a fold
+    def check_manifold(self) -> None:
+        for edge, triangles in self.edge_triangles.items():
+            if len(triangles) != 2 and (len(triangles) != 1 or not self.on_open_border(edge)):
+                raise RuntimeError(f"Edge {edge} is used by {len(triangles)} triangles")
+
+    def hypotenuse_neighbour(self, triangle):
+        for other in self.edge_triangles[self.edge_key(triangle[1], triangle[2])]:
+            if other != triangle:
+                return other
+        return None
+
+    def bisect(self, triangle) -> None:
+        apex, left, right = triangle
+        middle = ((left[0] + right[0]) // 2, (left[1] + right[1]) // 2)
+        self.remove_triangle(triangle)
+        self.add_triangle((middle, apex, left))
+        self.add_triangle((middle, right, apex))
+
+    def split(self, triangle) -> None:
+        neighbour = self.hypotenuse_neighbour(triangle)
+        if neighbour is not None and self.edge_key(neighbour[1], neighbour[2]) != self.edge_key(triangle[1], triangle[2]):
+            # the neighbour is one level coarser, splitting it puts a child on our hypotenuse
+            self.split(neighbour)
+            neighbour = self.hypotenuse_neighbour(triangle)
+        self.bisect(triangle)
+        if neighbour is not None:
+            self.bisect(neighbour)
+
+    # largest remaining split error, 0 once nothing can be refined
+    def max_error(self) -> float:
+        while self.heap and self.heap[0][2] not in self.leaves:
+            heapq.heappop(self.heap)
+        return -self.heap[0][0] if self.heap else 0.0
+
+    def refine_step(self) -> bool:
+        if self.max_error() <= 0:
+            return False
+        _, _, triangle = heapq.heappop(self.heap)
+        self.split(triangle)
+        return True
+
+    def mesh(self) -> IndexedMesh:
+        self.check_manifold()
+        index = {}
+        vertices = []
+        faces = np.empty((len(self.leaves), 3), dtype=np.int32)
+        for t, triangle in enumerate(self.leaves):
+            for k, vertex in enumerate(triangle):
+                key = self.wrap(vertex)
+                if key not in index:
+                    index[key] = len(vertices)
+                    vertices.append(self.points[key][1])
+                faces[t, k] = index[key]
+        return IndexedMesh(np.array(vertices), faces)
+
+# meshes of one surface at increasing detail, each level has about LOD_LEVEL_RATIO times the
+# triangles of the previous one; errors[k] is the largest split error left in levels[k]
+class LODHierarchy:
+    __slots__ = ("levels", "errors")
+
+    def __init__(self, levels: List[IndexedMesh], errors: List[float]):
+        self.levels = levels
+        self.errors = errors
+
+    # finest level with at most triangle_budget triangles (the coarsest if none fits)
+    def mesh_for_budget(self, triangle_budget: int) -> IndexedMesh:
+        counts = [len(level) for level in self.levels]
+        return self.levels[max(bisect.bisect_right(counts, triangle_budget) - 1, 0)]
+
+    # coarsest level whose error is within max_error (the finest if none is)
+    def mesh_for_error(self, max_error: float) -> IndexedMesh:
+        for level, error in zip(self.levels, self.errors):
+            if error <= max_error:
+                return level
+        return self.levels[-1]
 
+# refines worst error first up to max_triangles (or until the error drops to ADAPTIVE_MIN_ERROR)
+# and keeps a snapshot whenever the triangle count has grown by LOD_LEVEL_RATIO; cached per
+# surface function, parameter range, projection and triangle limit (the arguments are
+# normalized first, so positional, keyword and default calls share one cache entry)
+def build_lod_hierarchy(
+    surface_def,
+    u_range: Tuple[float, float] = (START_VAL, END_VAL),
+    v_range: Tuple[float, float] = (START_VAL, END_VAL),
+    D: float = D,
+    max_triangles: int = ADAPTIVE_MAX_TRIANGLES
+) -> LODHierarchy:
+    return cached_lod_hierarchy(
+        surface_def,
+        (float(u_range[0]), float(u_range[1])),
+        (float(v_range[0]), float(v_range[1])),
+        float(D),
+        int(max_triangles),
+    )
+
+@lru_cache(maxsize=LOD_CACHE_SIZE)
+def cached_lod_hierarchy(
+    surface_def,
+    u_range: Tuple[float, float],
+    v_range: Tuple[float, float],
+    D: float,
+    max_triangles: int
+) -> LODHierarchy:
+    tessellator = AdaptiveTessellator(surface_def, u_range, v_range, D)
+    levels = [tessellator.mesh()]
+    errors = [tessellator.max_error()]
+
+    while len(tessellator.leaves) < max_triangles and tessellator.max_error() > ADAPTIVE_MIN_ERROR:
+        tessellator.refine_step()
+        if len(tessellator.leaves) >= LOD_LEVEL_RATIO * len(levels[-1]):
+            levels.append(tessellator.mesh())
+            errors.append(tessellator.max_error())
+
+    if len(tessellator.leaves) > len(levels[-1]):
+        levels.append(tessellator.mesh())
+        errors.append(tessellator.max_error())
+
+    return LODHierarchy(levels, errors)
+
+# adaptive replacement for the uniform U_VALS x V_VALS grid: the mesh for a triangle budget or
+# for a maximum error, repeat calls for the same surface are served from the cached hierarchy;
+# the hierarchy is refined up to max_triangles, by default ADAPTIVE_MAX_TRIANGLES or the
+# budget if that is larger
+def adaptive_tessellation(
+    surface_def,
+    triangle_budget: int | None = None,
+    max_error: float | None = None,
+    u_range: Tuple[float, float] = (START_VAL, END_VAL),
+    v_range: Tuple[float, float] = (START_VAL, END_VAL),
+    D: float = D,
+    max_triangles: int | None = None
+) -> IndexedMesh:
+    if (triangle_budget is None) == (max_error is None):
+        raise ValueError("Pass exactly one of triangle_budget and max_error")
+    if max_triangles is None:
+        max_triangles = max(triangle_budget or 0, ADAPTIVE_MAX_TRIANGLES)
+
+    hierarchy = build_lod_hierarchy(surface_def, u_range=u_range, v_range=v_range, D=D, max_triangles=max_triangles)
+    if triangle_budget is not None:
+        return hierarchy.mesh_for_budget(triangle_budget)
+    return hierarchy.mesh_for_error(max_error)
+
+# projected float32 vertices of the u/v grid, chunk_rows grid rows (u values) at a time
+def grid_vertex_chunks(surface_def, u_vals: Sequence[float], v_vals: Sequence[float], D: float = D,
+                       chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[np.ndarray]:
+    for start in range(0, len(u_vals), chunk_rows):
+        grid = generate_surface_grid(surface_def, u_vals[start:start + chunk_rows], v_vals)
+        yield project_surface_to_2d(grid, D).reshape(-1, 3).astype(np.float32)
+
+# the faces of grid_faces(rows, cols), chunk_rows rows of grid cells at a time
+def grid_face_chunks(rows: int, cols: int, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[np.ndarray]:
+    for start in range(0, rows - 1, chunk_rows):
+        stop = min(start + chunk_rows, rows - 1)
+        yield grid_faces(stop - start + 1, cols) + np.int32(start * cols)
+
+def mesh_chunks(array: np.ndarray, chunk_size: int = EXPORT_CHUNK_ROWS * 1024) -> Iterator[np.ndarray]:
+    for start in range(0, len(array), chunk_size):
+        yield array[start:start + chunk_size]
+
+# binary little endian ply, float x/y/z vertices and uchar-count/int-index faces
+def write_ply(path: str, vertex_count: int, face_count: int,
+              vertex_chunks: Iterable[np.ndarray], face_chunks: Iterable[np.ndarray]) -> None:
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {vertex_count}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        f"element face {face_count}\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    )
+    with open(path, "wb") as file:
+        file.write(header.encode("ascii"))
+        for chunk in vertex_chunks:
+            file.write(np.ascontiguousarray(chunk, dtype="<f4").tobytes())
+        for chunk in face_chunks:
+            records = np.empty(len(chunk), dtype=PLY_FACE_DTYPE)
+            records["count"] = 3
+            records["indices"] = chunk
+            file.write(records.tobytes())
+
+# text obj, indices are 1-based
+def write_obj(path: str, vertex_chunks: Iterable[np.ndarray], face_chunks: Iterable[np.ndarray]) -> None:
+    with open(path, "w") as file:
+        for chunk in vertex_chunks:
+            np.savetxt(file, chunk, fmt="v %.9g %.9g %.9g")
+        for chunk in face_chunks:
+            np.savetxt(file, np.asarray(chunk, dtype=np.int64) + 1, fmt="f %d %d %d")
+
+# `mesh.npy` is stored as `mesh.vertices.npy` and `mesh.faces.npy`
+def npy_mesh_paths(path: str) -> Tuple[str, str]:
+    stem = path[:-len(".npy")] if path.endswith(".npy") else path
+    return f"{stem}.vertices.npy", f"{stem}.faces.npy"
+
+# both arrays are created as memory-mapped .npy files and filled chunk by chunk
+def write_npy(path: str, vertex_count: int, face_count: int,
+              vertex_chunks: Iterable[np.ndarray], face_chunks: Iterable[np.ndarray]) -> None:
+    vertices_path, faces_path = npy_mesh_paths(path)
+    for target_path, dtype, count, chunks in ((vertices_path, np.float32, vertex_count, vertex_chunks),
+                                              (faces_path, np.int32, face_count, face_chunks)):
+        target = np.lib.format.open_memmap(target_path, mode="w+", dtype=dtype, shape=(count, 3))
+        start = 0
+        for chunk in chunks:
+            target[start:start + len(chunk)] = chunk
+            start += len(chunk)
+        if start != count:
+            raise ValueError(f"Expected {count} rows for '{target_path}', got {start}")
+        target.flush()
+        del target
+
+def write_mesh_chunks(path: str, vertex_count: int, face_count: int,
+                      vertex_chunks: Iterable[np.ndarray], face_chunks: Iterable[np.ndarray]) -> None:
+    if path.endswith(".ply"):
+        write_ply(path, vertex_count, face_count, vertex_chunks, face_chunks)
+    elif path.endswith(".obj"):
+        write_obj(path, vertex_chunks, face_chunks)
+    elif path.endswith(".npy"):
+        write_npy(path, vertex_count, face_count, vertex_chunks, face_chunks)
+    else:
+        raise ValueError(f"Unknown mesh format for '{path}', expected .ply, .obj or .npy")
+
+# format from the file suffix (.ply, .obj or .npy)
+def export_mesh(mesh: IndexedMesh, path: str) -> None:
+    write_mesh_chunks(path, len(mesh.vertices), len(mesh.faces), mesh_chunks(mesh.vertices), mesh_chunks(mesh.faces))
+
+# the same file as export_mesh(IndexedMesh.from_grid(...)) without ever holding the grid: the
+# surface is evaluated and written a block of rows at a time and faces follow from the grid shape
+def export_surface(surface_def, u_vals: Sequence[float], v_vals: Sequence[float], path: str,
+                   D: float = D, chunk_rows: int = EXPORT_CHUNK_ROWS) -> None:
+    rows, cols = len(u_vals), len(v_vals)
+    write_mesh_chunks(path, rows * cols, 2 * (rows - 1) * (cols - 1),
+                      grid_vertex_chunks(surface_def, u_vals, v_vals, D, chunk_rows),
+                      grid_face_chunks(rows, cols, chunk_rows))
+
+# .npy pairs are memory-mapped straight into the mesh; binary ply vertices are memory-mapped
+# too, but ply faces are interleaved with their counts, so they are copied out
+def load_mesh(path: str, mmap_mode: str = "r") -> IndexedMesh:
+    if path.endswith(".npy"):
+        vertices_path, faces_path = npy_mesh_paths(path)
+        return IndexedMesh(np.load(vertices_path, mmap_mode=mmap_mode), np.load(faces_path, mmap_mode=mmap_mode))
+    if path.endswith(".ply"):
+        return load_ply(path, mmap_mode)
+    raise ValueError(f"Can only load .npy and binary .ply meshes, got '{path}'")
+
+def load_ply(path: str, mmap_mode: str = "r") -> IndexedMesh:
+    counts = {}
+    with open(path, "rb") as file:
+        if file.readline().strip() != b"ply":
+            raise ValueError(f"'{path}' is not a ply file")
+        while True:
+            line = file.readline()
+            if not line:
+                raise ValueError(f"'{path}' has no end_header")
+            words = line.split()
+            if words[:2] == [b"format", b"ascii"] or words[:2] == [b"format", b"binary_big_endian"]:
+                raise ValueError(f"'{path}' is not binary little endian")
+            if words[:1] == [b"element"]:
+                counts[words[1].decode()] = int(words[2])
+            if words == [b"end_header"]:
+                break
+        offset = file.tell()
+
+    vertex_count, face_count = counts.get("vertex", 0), counts.get("face", 0)
+    vertices = np.memmap(path, dtype="<f4", mode=mmap_mode, offset=offset, shape=(vertex_count, 3))
+    records = np.memmap(path, dtype=PLY_FACE_DTYPE, mode=mmap_mode, offset=offset + vertices.nbytes, shape=(face_count,))
+    if face_count and np.any(records["count"] != 3):
+        raise ValueError(f"'{path}' has faces that are not triangles")
+    return IndexedMesh(vertices, records["indices"])
+
+# one Line3D artist per triangle, interior edges are drawn twice
+def draw_triangles_3d(ax, triangles: List[Tuple[float, float, float]] | np.ndarray) -> None:
     for triangle in triangles:
         x = [p[0] for p in triangle] + [triangle[0][0]] # to connect last side to first
         y = [p[1] for p in triangle] + [triangle[0][1]]
         z = [p[2] for p in triangle] + [triangle[0][2]]
         ax.plot(x, y, z, color="black", linewidth=1)
 
+# every unique edge once, all in a single Line3DCollection artist
+def draw_mesh_wireframe(ax, mesh: IndexedMesh) -> None:
+    ax.add_collection3d(Line3DCollection(mesh.vertices[mesh.edges], colors="black", linewidths=1))
+    # collections do not update the data limits (flat axes keep the default range)
+    lower = mesh.vertices.min(axis=0)
+    upper = mesh.vertices.max(axis=0)
+    for set_limits, low, high in zip((ax.set_xlim, ax.set_ylim, ax.set_zlim), lower, upper):
+        if high > low:
+            set_limits(low, high)
+
+def label_wireframe_axes(ax) -> None:
     ax.set_xlabel("X")
     ax.set_ylabel("Y")
     ax.set_zlabel("Z")
     ax.set_title("3D Triangular Mesh (Wireframe)")
+
+def plot_triangles_3d(triangles: List[Tuple[float, float, float]] | np.ndarray) -> None:
+    fig = plt.figure(figsize=(8, 8))
+    ax = fig.add_subplot(111, projection="3d")
+    draw_triangles_3d(ax, triangles)
+    label_wireframe_axes(ax)
+    plt.show()
+
+def plot_mesh_wireframe(mesh: IndexedMesh) -> None:
+    fig = plt.figure(figsize=(8, 8))
+    ax = fig.add_subplot(111, projection="3d")
+    draw_mesh_wireframe(ax, mesh)
+    label_wireframe_axes(ax)
     plt.show()
 
+# headless wireframe of the projected mesh seen down the z axis (x right, y up): every edge is
+# sampled once per pixel step, samples are depth tested against a z-buffer (larger z is farther
+# away, z + D is the projection depth) and drawn darker the nearer they are
+def rasterize_wireframe(mesh: IndexedMesh, size: Tuple[int, int] = WIREFRAME_SIZE) -> np.ndarray:
+    width, height = size
+    image = np.full((height, width), WIREFRAME_BACKGROUND, dtype=np.uint8)
+    if len(mesh.edges) == 0:
+        return image
+
+    # fit the projected x/y bounds into the image with equal scale on both axes
+    vertices = mesh.vertices.astype(np.float64)
+    lower = vertices[:, :2].min(axis=0)
+    extent = np.maximum(vertices[:, :2].max(axis=0) - lower, 1e-12)
+    scale = (1 - 2 * WIREFRAME_MARGIN) * min((width - 1) / extent[0], (height - 1) / extent[1])
+    offset = (np.array([width - 1, height - 1]) - scale * extent) / 2
+    screen = np.empty_like(vertices)
+    screen[:, 0] = offset[0] + scale * (vertices[:, 0] - lower[0])
+    screen[:, 1] = (height - 1) - (offset[1] + scale * (vertices[:, 1] - lower[1]))
+    screen[:, 2] = vertices[:, 2]
+
+    z_near = screen[:, 2].min()
+    z_range = max(screen[:, 2].max() - z_near, 1e-12)
+    near_shade, far_shade = WIREFRAME_SHADES
+    z_buffer = np.full(width * height, np.inf)
+
+    for start in range(0, len(mesh.edges), WIREFRAME_EDGE_CHUNK):
+        edges = mesh.edges[start:start + WIREFRAME_EDGE_CHUNK]
+        p0 = screen[edges[:, 0]]
+        p1 = screen[edges[:, 1]]
+
+        # one sample per pixel along the longer screen axis, t in [0, 1] per edge
+        steps = np.ceil(np.abs(p1[:, :2] - p0[:, :2]).max(axis=1)).astype(np.int64)
+        counts = steps + 1
+        edge_index = np.repeat(np.arange(len(edges)), counts)
+        sample = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        t = sample / np.maximum(steps, 1)[edge_index]
+        points = p0[edge_index] + t[:, None] * (p1 - p0)[edge_index]
+
+        x = np.rint(points[:, 0]).astype(np.int64)
+        y = np.rint(points[:, 1]).astype(np.int64)
+        pixel = y * width + x
+        z = points[:, 2]
+
+        # nearest sample per pixel in this batch, then the depth test against earlier batches
+        order = np.lexsort((z, pixel))
+        pixel, z = pixel[order], z[order]
+        first = np.concatenate(([True], pixel[1:] != pixel[:-1]))
+        pixel, z = pixel[first], z[first]
+        visible = z < z_buffer[pixel]
+        pixel, z = pixel[visible], z[visible]
+
+        z_buffer[pixel] = z
+        shade = near_shade + (far_shade - near_shade) * (z - z_near) / z_range
+        image.flat[pixel] = np.rint(shade).astype(np.uint8)
+
+    return image
+
+def save_wireframe_png(mesh: IndexedMesh, filename: str = WIREFRAME_IMAGE_NAME,
+                       size: Tuple[int, int] = WIREFRAME_SIZE) -> None:
+    Image.fromarray(rasterize_wireframe(mesh, size)).save(filename)
+
+# draw time of the per-triangle artists, the single edge collection and the software
+# rasterizer per grid resolution, run with `python 6b.py --benchmark`; the per-triangle path
+# is skipped above legacy_max_grid where it takes too long to be useful
+def benchmark_wireframe_renderers(
+    grid_sizes: Tuple[int, ...] = (10, 30, 100, 300, 1000),
+    legacy_max_grid: int = 100,
+    repeats: int = 3
+) -> None:
+    def time_figure(draw) -> float:
+        elapsed = 0.0
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fig = Figure(figsize=(8, 8))
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot(111, projection="3d")
+            draw(ax)
+            fig.canvas.draw()
+            elapsed += time.perf_counter() - start
+        return elapsed / repeats
+
+    for grid_size in grid_sizes:
+        values = np.linspace(START_VAL, END_VAL, grid_size)
+        projection_grid = project_surface_to_2d(generate_surface_grid(torus, values, values), D)
+        mesh = IndexedMesh.from_grid(projection_grid)
+        mesh.edges  # derived once, like in an interactive session
+
+        timings = []
+        if grid_size <= legacy_max_grid:
+            triangles = mesh.triangles()
+            timings.append(("ax.plot per triangle", time_figure(lambda ax: draw_triangles_3d(ax, triangles))))
+        timings.append(("Line3DCollection", time_figure(lambda ax: draw_mesh_wireframe(ax, mesh))))
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            rasterize_wireframe(mesh)
+        timings.append(("z-buffer rasterizer", (time.perf_counter() - start) / repeats))
+
+        for name, elapsed in timings:
+            print(f"{grid_size}x{grid_size} grid ({len(mesh)} triangles) {name}: {elapsed * 1000:.1f} ms")
+
 def main():
     surfaces = [flat_plane, sphere, torus]
 
     for surface_def in surfaces:
         grid = generate_surface_grid(surface_def, U_VALS, V_VALS) 
         projection_grid = project_surface_to_2d(grid, D) 
-        triangles = create_triangle_mesh_from_projection_grid(projection_grid)  
-        plot_triangles_3d(triangles)  
+        mesh = IndexedMesh.from_grid(projection_grid)
+        plot_mesh_wireframe(mesh)
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv[1:]:
+        benchmark_wireframe_renderers()
+    else:
+        main()
@@ -1,56 +1,91 @@
-from typing import List
+import sys
+import time
+from typing import List, Tuple
 from PIL import Image
 import matplotlib.pyplot as plt
+import numpy as np
+from histogram_lut import (
+    apply_lut,
+    build_equalization_lut,
+    calculate_histogram,
+    calculate_tile_histograms,
+    clip_histograms,
+    apply_lut_to_files,
+    histogram_of_files,
+)
 
 IMAGE_PATH = './img.png'
 
-def read_grayscale_image(image_path: str) -> List[List[int]]:
-    img = Image.open(image_path).convert('L') 
-    width, height = img.size
-    pixels = list(img.getdata())
-
-    grayscale_img = [pixels[i * width:(i + 1) * width] for i in range(height)]
-    return grayscale_img
-
-def calculate_histogram(grayscale_image: List[List[int]]) -> List[int]:
-    histogram = [0] * 256
-    for row in grayscale_image:
-        for pixel in row:
-            histogram[pixel] += 1
-    return histogram
-
-def histogram_equalization(image: List[List[int]]) -> List[List[int]]:
-    height = len(image)
-    width = len(image[0]) if height > 0 else 0
-    total_pixels = height * width
+def read_grayscale_image(image_path: str) -> np.ndarray:
+    img = Image.open(image_path).convert('L')
+    return np.array(img)
 
+def histogram_equalization(image: List[List[int]] | np.ndarray, in_place: bool = False) -> np.ndarray:
     histogram = calculate_histogram(image)
-
-    cdf = [0 for _ in range(256)]
-    cumulative = 0
-    for i, count in enumerate(histogram):
-        cumulative += count
-        cdf[i] = cumulative
-
-    cdf_min = next(value for value in cdf if value > 0)
-
-    transform_map = [0 for _ in range(256)]
-    transform_map = [0] * 256
-    for i in range(256):
-        if cdf[i] == 0:
-            transform_map[i] = 0
-        else:
-            val = round((cdf[i] - cdf_min) / (total_pixels - cdf_min) * 255)
-            val = max(0, min(255, val)) 
-            transform_map[i] = val
-
-    equalized_image = []
-
-    for row in image:
-        new_row = [transform_map[pixel] for pixel in row]
-        equalized_image.append(new_row)
-
-    return equalized_image
+    transform_map = build_equalization_lut(histogram)
+    return apply_lut(image, transform_map, in_place)
+
+# one transform_map for a whole set of images (or .npy strips too big for memory),
+# built from a streamed histogram and applied in a second streaming pass
+def equalize_files(image_paths: List[str], output_paths: List[str], workers: int = 1) -> np.ndarray:
+    transform_map = histogram_of_files(image_paths, workers).equalization_lut()
+    apply_lut_to_files(image_paths, output_paths, transform_map, workers)
+    return transform_map
+
+# CLAHE: one clipped transform_map per tile of the grid, every pixel blends the maps
+# of the four nearest tile centres bilinearly so there are no seams between tiles
+def adaptive_histogram_equalization(
+    image: List[List[int]] | np.ndarray,
+    tile_grid: Tuple[int, int] = (8, 8),
+    clip_limit: float = 2.0,
+    workers: int = 1
+) -> np.ndarray:
+    image = np.asarray(image, dtype=np.uint8)
+    height, width = image.shape
+    rows, cols = tile_grid
+
+    # histograms are counted on the image reflected up to a whole number of tiles
+    tile_height = -(-height // rows)
+    tile_width = -(-width // cols)
+    padded = np.pad(image, ((0, rows * tile_height - height), (0, cols * tile_width - width)), mode='symmetric')
+
+    histograms = clip_histograms(calculate_tile_histograms(padded, tile_grid, workers), clip_limit)
+    transform_maps = build_equalization_lut(histograms).astype(np.float32)
+
+    # position of every row / column relative to the tile centres
+    def neighbours(size: int, tile_size: int, count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        position = np.clip((np.arange(size) + 0.5) / tile_size - 0.5, 0, count - 1)
+        first = np.floor(position).astype(np.intp)
+        second = np.minimum(first + 1, count - 1)
+        return first, second, (position - first).astype(np.float32)
+
+    top, bottom, y_weight = neighbours(height, tile_height, rows)
+    left, right, x_weight = neighbours(width, tile_width, cols)
+    y_weight = y_weight[:, None]
+
+    upper = transform_maps[top[:, None], left, image] * (1 - x_weight) + transform_maps[top[:, None], right, image] * x_weight
+    lower = transform_maps[bottom[:, None], left, image] * (1 - x_weight) + transform_maps[bottom[:, None], right, image] * x_weight
+
+    return np.rint(upper * (1 - y_weight) + lower * y_weight).astype(np.uint8)
+
+# run with `python 9b.py --benchmark`
+def benchmark_adaptive_histogram_equalization(
+    shape: Tuple[int, int] = (2160, 3840),
+    worker_counts: Tuple[int, ...] = (1, 2, 4),
+    repeats: int = 3
+) -> None:
+    rng = np.random.default_rng(0)
+    # smooth gradient with noise, like an unevenly lit frame
+    gradient = np.linspace(0, 180, shape[1])[None, :] + np.linspace(0, 60, shape[0])[:, None]
+    frame = np.clip(gradient + rng.normal(0, 10, shape), 0, 255).astype(np.uint8)
+
+    for workers in worker_counts:
+        adaptive_histogram_equalization(frame, workers=workers)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            adaptive_histogram_equalization(frame, workers=workers)
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"CLAHE {shape[1]}x{shape[0]} workers={workers}: {elapsed * 1000:.1f} ms per frame")
 
 
 def save_image_comparison(original: List[List[int]], equalized: List[List[int]]):
@@ -78,4 +113,7 @@ def main():
     save_image_comparison(grayscale_image, equalized_image)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--benchmark" in sys.argv[1:]:
+        benchmark_adaptive_histogram_equalization()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,260 @@
+import argparse
+import glob
+import importlib
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Tuple
+from PIL import Image
+import numpy as np
+
+# the lab scripts start with a digit, so they can only be imported by name
+equalization = importlib.import_module('9b')
+filtering = importlib.import_module('10a')
+segmentation = importlib.import_module('11a')
+
+OPERATIONS = ('equalize', 'clahe', 'filter', 'otsu')
+
+MASKS = {
+    'sharpen3': filtering.SHARPEN_MASK_3x3,
+    'blur3': filtering.BLUR_MASK_3x3,
+    'sharpen5': filtering.SHARPEN_MASK_5x5,
+    'blur5': filtering.BLUR_MASK_5x5,
+}
+
+IMAGE_PATTERNS = ('*.png', '*.jpg', '*.jpeg', '*.bmp', '*.tif', '*.tiff')
+
+# runs in the worker processes, returns the result and the seconds spent on it
+def process_image(operation: str, options: Dict[str, object], image: np.ndarray) -> Tuple[np.ndarray, float]:
+    start = time.perf_counter()
+
+    if operation == 'equalize':
+        result = equalization.histogram_equalization(image, in_place=True)
+    elif operation == 'clahe':
+        result = equalization.adaptive_histogram_equalization(image)
+    elif operation == 'filter':
+        result = filtering.apply_mask_to_image(
+            MASKS[options['mask']], image, options['border'], output='uint8', method=options['method']
+        )
+    elif operation == 'otsu':
+        threshold = segmentation.calculate_threshold(segmentation.calculate_histogram(image))
+        result = segmentation.apply_threshhold_to_image(image, threshold, in_place=True)
+        if options['pack_bits']:
+            result = segmentation.pack_binary_image(result)
+    else:
+        raise ValueError(f"operation must be one of {OPERATIONS}, got '{operation}'")
+
+    return result, time.perf_counter() - start
+
+# the whole input file name is kept (a.png -> a.png.png, a.bmp -> a.bmp.png),
+# so inputs that only differ in their extension get their own output
+def output_path_for(input_path: str, output_dir: str, packed: bool) -> str:
+    return os.path.join(output_dir, os.path.basename(input_path) + ('.bits.npz' if packed else '.png'))
+
+# packed masks keep their real width, the packed rows are padded to whole bytes
+def write_result(output_path: str, result: np.ndarray, width: int, packed: bool) -> None:
+    if packed:
+        np.savez(output_path, bits=result, width=width)
+    else:
+        Image.fromarray(result).save(output_path)
+
+# decoder threads fill a bounded queue, so at most `prefetch` decoded images wait for a worker;
+# a file that fails to decode comes through with image None and the error message, the others keep going;
+# with a `window` semaphore a decoder takes a ticket before starting a file and the consumer
+# gives it back once the file is done, which bounds decoded-but-unfinished files in total
+def prefetch_images(
+    paths: List[str],
+    prefetch: int,
+    decoders: int,
+    window: threading.Semaphore | None = None
+) -> Iterator[Tuple[int, str, np.ndarray | None, float, str | None]]:
+    decoded: queue.Queue = queue.Queue(maxsize=prefetch)
+    pending: queue.Queue = queue.Queue()
+    for item in enumerate(paths):
+        pending.put(item)
+
+    def decode() -> None:
+        while True:
+            if window is not None:
+                window.acquire()
+            try:
+                index, path = pending.get_nowait()
+            except queue.Empty:
+                if window is not None:
+                    window.release()
+                decoded.put(None)
+                return
+            start = time.perf_counter()
+            try:
+                image = np.array(Image.open(path).convert('L'))
+            except Exception as error:
+                decoded.put((index, path, None, time.perf_counter() - start, f"{type(error).__name__}: {error}"))
+                continue
+            decoded.put((index, path, image, time.perf_counter() - start, None))
+
+    threads = [threading.Thread(target=decode, daemon=True) for _ in range(decoders)]
+    for thread in threads:
+        thread.start()
+
+    finished = 0
+    while finished < len(threads):
+        item = decoded.get()
+        if item is None:
+            finished += 1
+        else:
+            yield item
+
+def run_batch(
+    operation: str,
+    paths: List[str],
+    output_dir: str,
+    workers: int | None = None,
+    prefetch: int = 8,
+    decoders: int = 2,
+    ordered: bool = True,
+    options: Dict[str, object] | None = None
+) -> List[Dict[str, object]]:
+    options = {'mask': 'sharpen3', 'border': 'zero', 'method': 'direct', 'pack_bits': False, **(options or {})}
+    packed = operation == 'otsu' and bool(options['pack_bits'])
+
+    # files with the same name in different input directories would overwrite each other
+    output_counts = Counter(output_path_for(path, output_dir, packed) for path in paths)
+    clashes = sorted(path for path, count in output_counts.items() if count > 1)
+    if clashes:
+        raise ValueError(f"Several inputs would be written to {', '.join(clashes)}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    stats: List[Dict[str, object]] = []
+    in_flight: Dict[Future, Tuple[int, str, int, float]] = {}
+    waiting: Dict[int, Tuple[str, np.ndarray | None, int, float, float, str | None]] = {}
+    next_index = 0
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    # files are taken for decoding in input order, so the oldest unwritten one always holds a
+    # ticket and the window can't deadlock ordered mode
+    window = threading.Semaphore(max_in_flight + prefetch + decoders)
+    start = time.perf_counter()
+
+    # a failed file (error set, no result) is recorded in the stats instead of stopping the run
+    def write(index: int, path: str, result: np.ndarray | None, width: int, decode_seconds: float,
+              process_seconds: float, error: str | None = None) -> None:
+        output_path = output_path_for(path, output_dir, packed)
+        write_start = time.perf_counter()
+        if error is None:
+            try:
+                write_result(output_path, result, width, packed)
+            except Exception as write_error:
+                error = f"write failed, {type(write_error).__name__}: {write_error}"
+        stats.append({
+            'index': index,
+            'input': path,
+            'output': output_path if error is None else None,
+            'pixels': result.shape[0] * width if error is None else 0,
+            'decode_seconds': decode_seconds,
+            'process_seconds': process_seconds,
+            'write_seconds': time.perf_counter() - write_start,
+            'error': error,
+        })
+        window.release()
+
+    def finish(index: int, entry: Tuple[str, np.ndarray | None, int, float, float, str | None]) -> None:
+        nonlocal next_index
+        if not ordered:
+            write(index, *entry)
+            return
+        waiting[index] = entry
+        while next_index in waiting:
+            write(next_index, *waiting.pop(next_index))
+            next_index += 1
+
+    # ordered mode holds finished results back until every earlier file has been written
+    def collect(done: set) -> None:
+        for future in done:
+            index, path, width, decode_seconds = in_flight.pop(future)
+            try:
+                result, process_seconds = future.result()
+            except Exception as error:
+                finish(index, (path, None, width, decode_seconds, 0.0, f"processing failed, {type(error).__name__}: {error}"))
+                continue
+            finish(index, (path, result, width, decode_seconds, process_seconds, None))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for index, path, image, decode_seconds, error in prefetch_images(paths, prefetch, decoders, window):
+            if image is None:
+                finish(index, (path, None, 0, decode_seconds, 0.0, f"decode failed, {error}"))
+                continue
+            # results held back for ordering count too, or a slow early file lets them pile up;
+            # with nothing in flight the oldest file is still decoding and this one has to go in
+            while in_flight and len(in_flight) + len(waiting) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            future = executor.submit(process_image, operation, options, image)
+            in_flight[future] = (index, path, image.shape[1], decode_seconds)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    report_throughput(stats, time.perf_counter() - start)
+    return stats
+
+def report_throughput(stats: List[Dict[str, object]], elapsed: float) -> None:
+    for entry in stats:
+        if entry['error'] is not None:
+            print(f"{entry['input']}: FAILED, {entry['error']}")
+            continue
+        total = entry['decode_seconds'] + entry['process_seconds'] + entry['write_seconds']
+        print(
+            f"{entry['input']}: decode {entry['decode_seconds'] * 1000:.1f} ms, "
+            f"process {entry['process_seconds'] * 1000:.1f} ms, write {entry['write_seconds'] * 1000:.1f} ms, "
+            f"{entry['pixels'] / max(total, 1e-9) / 1e6:.1f} MP/s"
+        )
+
+    pixels = sum(entry['pixels'] for entry in stats)
+    failed = sum(entry['error'] is not None for entry in stats)
+    print(
+        f"{len(stats)} files in {elapsed:.2f} s: {len(stats) / max(elapsed, 1e-9):.1f} files/s, "
+        f"{pixels / max(elapsed, 1e-9) / 1e6:.1f} MP/s"
+        + (f", {failed} failed" if failed else "")
+    )
+
+def find_images(input_dir: str) -> List[str]:
+    paths = set()
+    for pattern in IMAGE_PATTERNS:
+        paths.update(glob.glob(os.path.join(input_dir, pattern)))
+    return sorted(paths)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run equalization, filtering or Otsu segmentation over a directory of images")
+    parser.add_argument('operation', choices=OPERATIONS)
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--prefetch', type=int, default=8, help="decoded images allowed to wait for a worker")
+    parser.add_argument('--decoders', type=int, default=2, help="image decoding threads")
+    parser.add_argument('--unordered', action='store_true', help="write results as they finish instead of in input order")
+    parser.add_argument('--mask', choices=list(MASKS), default='sharpen3', help="mask for the filter operation")
+    parser.add_argument('--border', choices=list(filtering.BORDER_MODES), default='zero', help="border mode for the filter operation")
+    parser.add_argument('--method', choices=filtering.METHODS, default='direct', help="convolution method for the filter operation")
+    parser.add_argument('--pack-bits', action='store_true', help="store otsu masks with 1 bit per pixel (.bits.npz)")
+    args = parser.parse_args()
+
+    paths = find_images(args.input_dir)
+    if not paths:
+        raise FileNotFoundError(f"Error: No images found in '{args.input_dir}'")
+
+    run_batch(
+        args.operation,
+        paths,
+        args.output_dir,
+        workers=args.workers,
+        prefetch=args.prefetch,
+        decoders=args.decoders,
+        ordered=not args.unordered,
+        options={'mask': args.mask, 'border': args.border, 'method': args.method, 'pack_bits': args.pack_bits},
+    )
+
+if __name__ == "__main__":
+    main()
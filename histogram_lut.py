@@ -0,0 +1,196 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterable, Iterator, List, Sequence, Tuple
+from PIL import Image
+import numpy as np
+
+GRAY_LEVELS = 256
+# rows per chunk when streaming memory-mapped .npy images
+CHUNK_ROWS = 1024
+
+def as_uint8_image(grayscale_image: List[List[int]] | np.ndarray) -> np.ndarray:
+    image = np.asarray(grayscale_image)
+    if image.dtype != np.uint8:
+        image = image.astype(np.uint8)
+    return image
+
+def calculate_histogram(grayscale_image: List[List[int]] | np.ndarray) -> np.ndarray:
+    return np.bincount(as_uint8_image(grayscale_image).ravel(), minlength=GRAY_LEVELS)
+
+# maps every pixel through a 256 entry table in one gather, in_place needs a uint8 ndarray
+def apply_lut(
+    grayscale_image: List[List[int]] | np.ndarray,
+    lut: List[int] | np.ndarray,
+    in_place: bool = False
+) -> np.ndarray:
+    lut = np.asarray(lut, dtype=np.uint8)
+    if lut.shape != (GRAY_LEVELS,):
+        raise ValueError(f"LUT must have {GRAY_LEVELS} entries, got shape {lut.shape}")
+
+    if not in_place:
+        return lut[as_uint8_image(grayscale_image)]
+
+    if not isinstance(grayscale_image, np.ndarray) or grayscale_image.dtype != np.uint8 or not grayscale_image.flags.writeable:
+        raise TypeError("in_place=True needs a writeable uint8 numpy array")
+    np.take(lut, grayscale_image, out=grayscale_image, mode='clip')
+    return grayscale_image
+
+# transform_map of histogram equalization: scaled CDF, the darkest used level maps to 0;
+# a (..., 256) stack of histograms gives a (..., 256) stack of maps
+def build_equalization_lut(histogram: List[int] | np.ndarray) -> np.ndarray:
+    cdf = np.cumsum(np.asarray(histogram, dtype=np.int64), axis=-1)
+    total_pixels = cdf[..., -1:]
+    cdf_min = np.take_along_axis(cdf, np.argmax(cdf > 0, axis=-1)[..., None], axis=-1)
+
+    # a single gray level leaves nothing to spread, it maps to 0 like cdf_min always does
+    spread = total_pixels - cdf_min
+    with np.errstate(divide='ignore', invalid='ignore'):
+        transform_map = np.rint((cdf - cdf_min) / spread * 255)
+    transform_map = np.where((cdf == 0) | (spread == 0), 0, np.clip(transform_map, 0, 255))
+    return transform_map.astype(np.uint8)
+
+# counts of every tile at once: each pixel is labelled with its tile and counted exactly once
+def count_tiles(tiles: np.ndarray) -> np.ndarray:
+    rows, _, cols, _ = tiles.shape
+    tile_index = (np.arange(rows).reshape(rows, 1, 1, 1) * cols + np.arange(cols).reshape(1, 1, cols, 1)) * GRAY_LEVELS
+    labels = (tile_index + tiles).ravel()
+    return np.bincount(labels, minlength=rows * cols * GRAY_LEVELS).reshape(rows, cols, GRAY_LEVELS)
+
+# (rows, cols, 256) histograms of an image that splits evenly into the tile grid;
+# with workers > 1 bands of tile rows are counted in parallel processes
+def calculate_tile_histograms(image: np.ndarray, tile_grid: Tuple[int, int], workers: int = 1) -> np.ndarray:
+    image = as_uint8_image(image)
+    rows, cols = tile_grid
+    height, width = image.shape
+    if height % rows or width % cols:
+        raise ValueError(f"Image of shape {image.shape} does not split evenly into a {tile_grid} tile grid")
+
+    tiles = image.reshape(rows, height // rows, cols, width // cols)
+    if workers <= 1 or rows == 1:
+        return count_tiles(tiles)
+
+    bands = np.array_split(np.arange(rows), min(workers, rows))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counts = executor.map(count_tiles, [tiles[band[0]:band[-1] + 1] for band in bands])
+        return np.concatenate(list(counts), axis=0)
+
+# CLAHE contrast limit: bins above clip_limit * (mean bin count) are cut and the excess is
+# spread evenly over all bins, so every histogram keeps its pixel count
+def clip_histograms(histograms: np.ndarray, clip_limit: float) -> np.ndarray:
+    histograms = np.asarray(histograms, dtype=np.int64)
+    tile_pixels = histograms.sum(axis=-1, keepdims=True)
+    limit = np.maximum(1, (clip_limit * tile_pixels / GRAY_LEVELS).astype(np.int64))
+
+    excess = np.maximum(histograms - limit, 0).sum(axis=-1, keepdims=True)
+    clipped = np.minimum(histograms, limit) + excess // GRAY_LEVELS
+
+    # the leftover excess % 256 pixels go one each to evenly spaced bins
+    residual = excess % GRAY_LEVELS
+    levels = np.arange(GRAY_LEVELS)
+    clipped += (levels + 1) * residual // GRAY_LEVELS - levels * residual // GRAY_LEVELS
+    return clipped
+
+# quantizer for sorted thresholds t1 < t2 < ...: levels up to t1 are class 0, (t1, t2] class 1, ...,
+# classes are spread evenly over 0..255, so a single threshold gives the usual 0 / 255 binarization
+def build_threshold_lut(threshold: int | Sequence[int]) -> np.ndarray:
+    thresholds = np.atleast_1d(np.asarray(threshold))
+    classes = np.searchsorted(thresholds, np.arange(GRAY_LEVELS), side='left')
+    return np.rint(classes * 255 / len(thresholds)).astype(np.uint8)
+
+# histogram that is filled chunk by chunk (rows of one image, or many images) and can be
+# merged with partial histograms from other workers, saved and loaded again
+class StreamingHistogram:
+    def __init__(self, counts: List[int] | np.ndarray | None = None):
+        self.counts = np.zeros(GRAY_LEVELS, dtype=np.int64)
+        if counts is not None:
+            self.counts += np.asarray(counts, dtype=np.int64)
+
+    @property
+    def total_pixels(self) -> int:
+        return int(self.counts.sum())
+
+    def update(self, chunk: List[List[int]] | np.ndarray) -> 'StreamingHistogram':
+        self.counts += calculate_histogram(chunk)
+        return self
+
+    def update_from(self, chunks: Iterable[np.ndarray]) -> 'StreamingHistogram':
+        for chunk in chunks:
+            self.update(chunk)
+        return self
+
+    def merge(self, other: 'StreamingHistogram') -> 'StreamingHistogram':
+        self.counts += other.counts
+        return self
+
+    # np.save appends .npy to paths without it, both methods do the same so 'hist' loads 'hist.npy'
+    @staticmethod
+    def npy_path(path: str) -> str:
+        return path if path.endswith('.npy') else path + '.npy'
+
+    def save(self, path: str) -> None:
+        np.save(self.npy_path(path), self.counts)
+
+    @classmethod
+    def load(cls, path: str) -> 'StreamingHistogram':
+        return cls(np.load(cls.npy_path(path)))
+
+    def equalization_lut(self) -> np.ndarray:
+        return build_equalization_lut(self.counts)
+
+# .npy images are memory-mapped and read chunk_rows at a time, other formats are decoded whole
+def iterate_image_chunks(image_path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[np.ndarray]:
+    if image_path.endswith('.npy'):
+        image = np.load(image_path, mmap_mode='r')
+        for y in range(0, image.shape[0], chunk_rows):
+            yield np.asarray(image[y:y + chunk_rows])
+    else:
+        yield np.array(Image.open(image_path).convert('L'))
+
+def histogram_of_file(image_path: str, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    return StreamingHistogram().update_from(iterate_image_chunks(image_path, chunk_rows)).counts
+
+# one histogram over every image, with workers > 1 files are counted in parallel and the partial histograms merged
+def histogram_of_files(image_paths: Iterable[str], workers: int = 1, chunk_rows: int = CHUNK_ROWS) -> StreamingHistogram:
+    histogram = StreamingHistogram()
+    if workers <= 1:
+        for image_path in image_paths:
+            histogram.update_from(iterate_image_chunks(image_path, chunk_rows))
+        return histogram
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for counts in executor.map(histogram_of_file, image_paths, repeat(chunk_rows)):
+            histogram.merge(StreamingHistogram(counts))
+    return histogram
+
+# second streaming pass: .npy goes chunk by chunk into a memory-mapped .npy output,
+# other formats are decoded, mapped and saved with PIL
+def apply_lut_to_file(input_path: str, output_path: str, lut: List[int] | np.ndarray, chunk_rows: int = CHUNK_ROWS) -> None:
+    if not input_path.endswith('.npy'):
+        Image.fromarray(apply_lut(next(iterate_image_chunks(input_path)), lut, in_place=True)).save(output_path)
+        return
+
+    image = np.load(input_path, mmap_mode='r')
+    result = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.uint8, shape=image.shape)
+    for y, chunk in zip(range(0, image.shape[0], chunk_rows), iterate_image_chunks(input_path, chunk_rows)):
+        result[y:y + chunk_rows] = apply_lut(chunk, lut)
+    result.flush()
+    del result
+
+def apply_lut_to_files(
+    input_paths: List[str],
+    output_paths: List[str],
+    lut: List[int] | np.ndarray,
+    workers: int = 1,
+    chunk_rows: int = CHUNK_ROWS
+) -> None:
+    if len(input_paths) != len(output_paths):
+        raise ValueError("input_paths and output_paths must have the same length")
+    lut = np.asarray(lut, dtype=np.uint8)
+
+    if workers <= 1:
+        for input_path, output_path in zip(input_paths, output_paths):
+            apply_lut_to_file(input_path, output_path, lut, chunk_rows)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(apply_lut_to_file, input_paths, output_paths, repeat(lut), repeat(chunk_rows)))